@@ -1,34 +1,104 @@
+from history_archive import HistoryArchive
+from journal import Journal, JournalLockedError
 from phone_book import PhoneBook
+from snapshot import is_snapshot_current
+from sqlite_phone_book import SQLitePhoneBook
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import argparse
+import atexit
+import contextlib
+import json
 import logging
+import os
+import queue
+import sys
+import time
 
-def init_logging():
-    logging.basicConfig(
-        filename='phonebook_log.log', 
-        encoding='utf-8',
-        format='%(asctime)s %(message)s', 
-        datefmt='%m/%d/%Y %I:%M:%S %p',
-        level=logging.DEBUG
-    )
+def init_logging(log_file='phonebook_log.log', max_bytes=5 * 1024 * 1024, backup_count=3):
+    '''
+    Send log records through a queue to a background thread that writes them to log_file,
+    so logging never blocks on file I/O
+    The log file is rotated when it reaches max_bytes, keeping backup_count old files
+    '''
+    root_logger = logging.getLogger()
+    if any(isinstance(handler, QueueHandler) for handler in root_logger.handlers):
+        return
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p'))
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(logging.DEBUG)
+    listener.start()
+    # Write the records still in the queue before the program exits
+    atexit.register(listener.stop)
+
+def open_phone_book(sqlite_path=None, build_indexes=True):
+    '''
+    Open the phone book: import database.json and replay database.journal on top of it,
+    or open the SQLite database at sqlite_path (importing database.json if it is empty)
+    database.snapshot, a binary copy of database.json, is imported instead when it is at least as recent,
+    and is written after importing database.json otherwise
+    Archived history is kept in database.history (or next to the SQLite database)
+    If build_indexes is True, the search and sort indexes are then built in the background (see
+    PhoneBook.build_indexes_in_background), otherwise each is built by the first search or sort needing it
+    Raise JournalLockedError if database.journal is open in another process
+    '''
+    if sqlite_path:
+        phone_book = SQLitePhoneBook(sqlite_path)
+        if not phone_book.sorted_contacts('create_time', stop=1):
+            print("Importing contacts ...")
+            phone_book.import_contacts_from_json("database.json")
+    else:
+        # Locked before database.json is read, so another process cannot compact it in the meantime
+        journal = Journal("database.journal")
+        phone_book = PhoneBook()
+        print("Importing contacts ...")
+        if not (is_snapshot_current("database.snapshot", "database.json")
+                and phone_book.import_contacts_from_snapshot("database.snapshot")):
+            if phone_book.import_contacts_from_json("database.json"):
+                phone_book.export_contacts_to_snapshot("database.snapshot")
+        phone_book.open_journal(journal, "database.json", "database.snapshot")
+        if build_indexes:
+            phone_book.build_indexes_in_background()
+    phone_book.history_archive = HistoryArchive(sqlite_path + ".history" if sqlite_path else "database.history")
+    return phone_book
+
+def close_phone_book(phone_book):
+    '''
+    Close the database or the journal of a phone book opened by open_phone_book
+    '''
+    if isinstance(phone_book, SQLitePhoneBook):
+        phone_book.close()
+    else:
+        phone_book.close_journal()
 
-def main():
+def main(sqlite_path=None, stats_file='phonebook_stats.json', trace_memory=False):
     '''
     Main function to run the Phone Book Management System
         - Initialize logging
         - Create a PhoneBook object
-        - Import contacts from database.json
+        - Import contacts from database.json and replay the changes journaled in database.journal
         - Display menu options
-        - Perform actions based on user input
-        - Export contacts to database.json before exiting
+        - Perform actions based on user input, each change is appended to database.journal
+        - Close the journal and write the operation statistics to stats_file before exiting
+    If sqlite_path is given, contacts are stored in that SQLite database instead,
+    and database.json is only imported when the database is empty
+    If trace_memory is True, the memory peak of every operation is measured from the start
     '''
     init_logging()
     logger = logging.getLogger("phoneBookLogger")
     logger.info("Start Phone Book Management System")
 
-    phone_book = PhoneBook()
-
     print("Entering phone book management system ...")
-    print("Importing contacts ...")
-    phone_book.import_contacts_from_json("database.json")
+    try:
+        phone_book = open_phone_book(sqlite_path)
+    except JournalLockedError as error:
+        print(f"Error: {error}")
+        logger.info(f"Exit Phone Book Management System: {error}")
+        return
+    phone_book.stats.set_memory_tracing(trace_memory)
     print()
 
     while True:
@@ -40,18 +110,22 @@ def main():
         print("5. Delete contact")
         print("6. Sort contacts")
         print("7. Group contacts")
+        print("8. View statistics")
         print("Enter 'q' to quit.")
         
-        choice = input("Enter your choice (1/2/3/4/5/6/7/q): ").strip()
+        choice = input("Enter your choice (1/2/3/4/5/6/7/8/q): ").strip()
 
-        while choice not in ['1', '2', '3', '4', '5', '6', '7', 'q']:
+        while choice not in ['1', '2', '3', '4', '5', '6', '7', '8', 'q']:
             choice = input("Invalid choice. Please try again: ").strip()
 
         print()
         if choice == 'q':
             print("Exiting the Phone Book Management System ...")
-            print("Exporting contacts ...")
-            phone_book.export_contacts_to_json("database.json")
+            print("Saving contacts ...")
+            close_phone_book(phone_book)
+            if stats_file:
+                phone_book.stats.dump(stats_file)
+                print(f"Statistics written to {stats_file}")
             logger.info("Exit Phone Book Management System")
             break
         elif choice == '1':
@@ -68,6 +142,135 @@ def main():
             phone_book.sort_contacts()
         elif choice == '7':
             phone_book.group_contacts()
+        elif choice == '8':
+            phone_book.view_statistics()
+
+def contact_summary(contact):
+    '''
+    Return the fields of a contact (without history) for the machine-readable summary
+    '''
+    return {
+        "first_name": contact.get_first_name(),
+        "last_name": contact.get_last_name(),
+        "phone_number": contact.get_phone_number(),
+        "email_address": contact.get_email_address(),
+        "address": contact.get_address(),
+        "create_time": contact.get_create_time().isoformat(),
+        "update_time": contact.get_update_time().isoformat(),
+    }
+
+def run_command(phone_book, args):
+    '''
+    Run one batch command on an open phone book and return its summary as a dictionary
+    '''
+    quiet = args.quiet or args.json
+    if args.command == 'import-csv':
+        succeeded, attempted = phone_book.import_contacts_from_csv(args.csv_file, args.workers, quiet=quiet)
+        return {"attempted": attempted, "succeeded": succeeded, "failed": attempted - succeeded}
+    if args.command == 'delete-csv':
+        succeeded, attempted = phone_book.delete_contacts_from_csv(args.csv_file, quiet=quiet)
+        return {"attempted": attempted, "succeeded": succeeded, "failed": attempted - succeeded}
+    if args.command == 'archive-history':
+        if args.keep_last is None and args.keep_days is None:
+            raise ValueError("Give --keep-last and/or --keep-days")
+        contacts, changes = phone_book.archive_histories(args.keep_last, args.keep_days)
+        if not quiet:
+            print(f"{changes} changes of {contacts} contacts moved to {phone_book.history_archive.file_path}")
+        return {"contacts": contacts, "archived": changes}
+    if args.command == 'export':
+        phone_book.export_contacts_to_json(args.output, args.compact)
+        return {"output": args.output}
+
+    # search
+    # The shell splits an unquoted query such as: search name John Smith
+    if args.type == 'name':
+        matches = phone_book.find_contacts_by_name(' '.join(args.query))
+    elif args.type == 'phone':
+        matches = phone_book.find_contacts_by_phone(' '.join(args.query))
+    else:
+        if len(args.query) > 2:
+            raise ValueError(f"Give one date or a start and an end date, not {len(args.query)} values")
+        start_date = datetime.strptime(args.query[0], '%Y-%m-%d').date()
+        end_date = datetime.strptime(args.query[-1], '%Y-%m-%d').date()
+        matches = phone_book.find_contacts_by_date(start_date, end_date, 'create' if args.type == 'created' else 'update')
+    if not quiet:
+        for contact in matches:
+            print(f"{contact.get_first_name()} {contact.get_last_name()}, {contact.get_phone_number()}, "
+                  f"{contact.get_email_address()}, {contact.get_address()}")
+    return {"count": len(matches), "matches": [contact_summary(contact) for contact in matches]}
+
+def run_cli(args):
+    '''
+    Run a batch command without the interactive menu, for scripts and scheduled jobs
+    Changes are saved through the journal (or the SQLite database), so the JSON file is not rewritten
+    With --quiet only errors are printed, with --json a JSON summary is printed instead of the usual output
+    The operation statistics are written to --stats-file
+    Return the process exit code
+    '''
+    init_logging()
+    logger = logging.getLogger("phoneBookLogger")
+    logger.info(f"Start batch command: {args.command}")
+    summary = {"command": args.command, "status": "ok"}
+    start = time.perf_counter()
+    quiet = args.quiet or args.json
+    phone_book = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        try:
+            # A batch command runs one search or sort at most, it only builds the index it needs
+            phone_book = open_phone_book(args.sqlite, build_indexes=False)
+            phone_book.stats.set_memory_tracing(args.trace_memory)
+            with phone_book.journal_batch():
+                summary.update(run_command(phone_book, args))
+        except (FileNotFoundError, ValueError, JournalLockedError) as error:
+            summary.update({"status": "error", "error": str(error)})
+        finally:
+            if phone_book is not None:
+                close_phone_book(phone_book)
+    if args.stats_file and phone_book is not None:
+        phone_book.stats.dump(args.stats_file)
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"Finish batch command: {args.command}, status {summary['status']}")
+
+    if args.json:
+        print(json.dumps(summary))
+    elif summary["status"] == "error":
+        print(f"Error: {summary['error']}", file=sys.stderr)
+    elif not args.quiet and args.command != 'search':
+        print(f"{args.command} completed in {summary['seconds']} seconds")
+    return 0 if summary["status"] == "ok" else 1
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Phone Book Management System. Without a command, the interactive menu is started.")
+    parser.add_argument("--sqlite", metavar="DB_PATH", help="store contacts in a SQLite database instead of database.json")
+    parser.add_argument("--quiet", action="store_true", help="batch commands: only print errors")
+    parser.add_argument("--json", action="store_true", help="batch commands: print a machine-readable JSON summary")
+    parser.add_argument("--stats-file", default="phonebook_stats.json",
+                        help="file the operation statistics are written to on exit (default: phonebook_stats.json)")
+    parser.add_argument("--trace-memory", action="store_true", help="measure the memory peak of every operation (slower)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    import_csv = commands.add_parser("import-csv", help="add contacts from a CSV file")
+    import_csv.add_argument("csv_file")
+    import_csv.add_argument("--workers", type=int, help="number of validation processes (default: number of CPUs)")
+
+    delete_csv = commands.add_parser("delete-csv", help="delete the contacts listed in a CSV file")
+    delete_csv.add_argument("csv_file")
+
+    export = commands.add_parser("export", help="export all contacts to a JSON file")
+    export.add_argument("output")
+    export.add_argument("--compact", action="store_true", help="write the JSON without indentation (smaller and faster)")
+
+    archive = commands.add_parser("archive-history", help="move old changes of contact histories to the history archive")
+    archive.add_argument("--keep-last", type=int, metavar="N", help="keep the last N changes of each contact")
+    archive.add_argument("--keep-days", type=int, metavar="D", help="keep the changes of the last D days")
+
+    search = commands.add_parser("search", help="search contacts")
+    search.add_argument("type", choices=["name", "phone", "created", "updated"])
+    search.add_argument("query", nargs="+", help="name or phone query (partial match), or a date / date range (yyyy-mm-dd)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_arguments()
+    if args.command:
+        sys.exit(run_cli(args))
+    main(args.sqlite, args.stats_file, args.trace_memory)
\ No newline at end of file
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+import os
+
+@contextmanager
+def atomic_write(file_path, mode='w', before_replace=None):
+    '''
+    Open a temporary file next to file_path for writing
+    When the with block ends the file is flushed, synced to disk and renamed over file_path,
+    so file_path always holds either the old or the complete new content, even if the process dies mid-write
+    If the block raises, the temporary file is removed and file_path is left untouched
+    before_replace, if given, is called with the path of the complete temporary file just before the rename
+    '''
+    temp_path = file_path + ".tmp"
+    try:
+        with open(temp_path, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if before_replace is not None:
+        before_replace(temp_path)
+    os.replace(temp_path, file_path)
+
+def file_identity(file_path):
+    '''
+    Return a JSON-serializable value that changes whenever file_path is replaced or rewritten,
+    and is kept when a file is renamed to file_path; None if the file does not exist
+    '''
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
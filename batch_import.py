@@ -0,0 +1,69 @@
+from validation import is_valid_email, is_valid_phone_number
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import csv
+import os
+
+CHUNK_SIZE = 10000 # number of CSV rows validated by one worker task
+
+def validate_row(row):
+    '''
+    Normalize one CSV row (first_name, last_name, phone_number, email_address, address)
+    Return (first_name, last_name, phone_number, email_address, address, errors),
+    where errors lists the problems found with mandatory fields, phone number and email address
+    '''
+    first_name = row[0].strip() if row else ""
+    last_name = row[1].strip() if len(row) > 1 else ""
+    phone_number = row[2].strip() if len(row) > 2 else ""
+    email_address = row[3] if len(row) > 3 else ""
+    address = row[4] if len(row) > 4 else ""
+
+    errors = []
+    if not first_name:
+        errors.append("First name missing. ")
+    if not last_name: 
+        errors.append("Last name missing. ")
+    if not phone_number:
+        errors.append("Phone number missing. ")
+    if phone_number and not is_valid_phone_number(phone_number):
+        errors.append("Phone number invalid, should be in format (###) ###-####. ")
+    if email_address and not is_valid_email(email_address):
+        errors.append("Email address invalid. ")
+    return first_name, last_name, phone_number, email_address, address, errors
+
+def validate_chunk(rows):
+    '''
+    Validate a list of CSV rows, run in a worker process
+    '''
+    return [validate_row(row) for row in rows]
+
+def validated_rows(csv_file, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Read a CSV file of contacts in chunks and yield the result of validate_row for every row, in file order
+    Chunks are validated in parallel by up to workers processes (default: number of CPUs),
+    with at most two chunks per worker read ahead so memory stays bounded
+    A file that fits in one chunk is validated in this process
+    Raise FileNotFoundError if the file does not exist
+    '''
+    workers = workers or os.cpu_count() or 1
+    with open(csv_file, newline='') as file:
+        reader = csv.reader(file)
+        chunk = list(islice(reader, chunk_size))
+        next_chunk = list(islice(reader, chunk_size)) if workers > 1 else []
+        if not next_chunk:
+            # Small file or a single worker: a process pool would only add overhead
+            while chunk:
+                yield from validate_chunk(chunk)
+                chunk = list(islice(reader, chunk_size))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque([executor.submit(validate_chunk, chunk), executor.submit(validate_chunk, next_chunk)])
+            while pending:
+                while len(pending) < 2 * workers:
+                    chunk = list(islice(reader, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(validate_chunk, chunk))
+                yield from pending.popleft().result()
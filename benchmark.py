@@ -0,0 +1,210 @@
+from phone_book import PhoneBook, SORT_KEYS
+from search_cache import SearchCache
+from datetime import datetime, timedelta
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+               "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+               "Wei", "Fatima", "Mohammed", "Priya", "Hiroshi", "Olga", "Carlos", "Ana", "Kwame", "Ingrid"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+              "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+              "Nguyen", "Kim", "Patel", "Okafor", "Novak", "Schmidt", "Rossi", "Dubois", "Yamamoto", "Zhang"]
+STREETS = ["Main St", "Oak Ave", "Pine Rd", "Maple St", "Cedar Ln", "Elm St", "Birch Blvd", "Lake Dr", "Hill Rd", "Park Ave"]
+DOMAINS = ["example.com", "mail.com", "company.org", "school.edu"]
+UPDATE_FIELDS = [("Phone Number", "phone_number"), ("Email Address", "email_address"), ("Address", "address")]
+
+START_TIME = datetime(2020, 1, 1)
+
+def generate_contacts(count, history_depth=3, seed=0):
+    '''
+    Yield count contact dictionaries in the database.json format, the same ones for the same seed
+    Names are made unique by a numeric suffix on the last name once the name combinations run out
+    Each contact gets between 0 and 2 * history_depth updates (history_depth on average)
+    '''
+    generator = random.Random(seed)
+    combinations = len(FIRST_NAMES) * len(LAST_NAMES)
+    for number in range(count):
+        first_name = FIRST_NAMES[number % len(FIRST_NAMES)]
+        last_name = LAST_NAMES[(number // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        if number >= combinations:
+            last_name += str(number // combinations)
+        contact = {
+            "first_name": first_name,
+            "last_name": last_name,
+            "phone_number": f"({generator.randint(200, 999)}) {generator.randint(200, 999)}-{generator.randint(0, 9999):04d}",
+            "email_address": f"{first_name.lower()}.{last_name.lower()}@{generator.choice(DOMAINS)}",
+            "address": f"{generator.randint(1, 9999)} {generator.choice(STREETS)}",
+        }
+        create_time = START_TIME + timedelta(seconds=generator.randint(0, 4 * 365 * 86400), microseconds=number % 1000000)
+        history = [{
+            "operation": "Created",
+            "message": f"{first_name} {last_name}, {contact['phone_number']}, {contact['email_address']}, {contact['address']}",
+            "field": "", "old_value": "", "new_value": "",
+            "change_time": create_time.isoformat()
+        }]
+        update_time = create_time
+        for _ in range(generator.randint(0, 2 * history_depth)):
+            update_time += timedelta(seconds=generator.randint(60, 90 * 86400))
+            field, key = generator.choice(UPDATE_FIELDS)
+            if key == "phone_number":
+                new_value = f"({generator.randint(200, 999)}) {generator.randint(200, 999)}-{generator.randint(0, 9999):04d}"
+            elif key == "email_address":
+                new_value = f"{first_name.lower()}{generator.randint(1, 99)}@{generator.choice(DOMAINS)}"
+            else:
+                new_value = f"{generator.randint(1, 9999)} {generator.choice(STREETS)}"
+            history.append({"operation": "Updated", "message": "", "field": field, "old_value": contact[key],
+                            "new_value": new_value, "change_time": update_time.isoformat()})
+            contact[key] = new_value
+        contact["create_time"] = create_time.isoformat()
+        contact["update_time"] = update_time.isoformat()
+        contact["history"] = history
+        yield contact
+
+def write_database(file_path, contacts):
+    '''
+    Write contact dictionaries to a JSON file in the database.json format, one contact at a time
+    '''
+    with open(file_path, 'w') as json_file:
+        json_file.write("[")
+        for number, contact in enumerate(contacts):
+            json_file.write(",\n" if number else "\n")
+            json_file.write(json.dumps(contact, indent=4))
+        json_file.write("\n]")
+
+def write_csv_files(add_path, delete_path, contacts, count, seed=0):
+    '''
+    Write a batch add CSV of count rows (a tenth of them already in the book, a tenth invalid)
+    and a batch delete CSV of count names (a tenth of them not in the book)
+    '''
+    generator = random.Random(seed)
+    sample = generator.sample(contacts, min(count, len(contacts)))
+    with open(add_path, 'w') as add_file:
+        for number in range(count):
+            if number % 10 == 0 and sample:
+                contact = sample[number % len(sample)]
+                first_name, last_name = contact.get_first_name(), contact.get_last_name()
+            else:
+                first_name, last_name = f"New{number}", generator.choice(LAST_NAMES)
+            phone_number = "555-0100" if number % 10 == 5 else \
+                f"({generator.randint(200, 999)}) {generator.randint(200, 999)}-{generator.randint(0, 9999):04d}"
+            add_file.write(f"{first_name},{last_name},{phone_number},{first_name.lower()}@example.com,1 Main St\n")
+    with open(delete_path, 'w') as delete_file:
+        for number, contact in enumerate(sample):
+            name = f"Nobody {number}" if number % 10 == 0 else f"{contact.get_first_name()} {contact.get_last_name()}"
+            delete_file.write(name + "\n")
+
+class Benchmark:
+    '''
+    Class to time phone book operations and collect the results
+    '''
+    def __init__(self, measure_memory=False):
+        self.measure_memory = measure_memory
+        self.results = {}
+
+    def run(self, name, function, items=1):
+        '''
+        Run function once with its output discarded, record its duration, the throughput in items per second
+        and, if memory is measured, the peak memory allocated while it ran
+        Return the result of function
+        '''
+        if self.measure_memory:
+            tracemalloc.start()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - start
+        result_entry = {"seconds": round(seconds, 6), "items": items,
+                        "items_per_second": round(items / seconds, 1) if seconds > 0 else None}
+        if self.measure_memory:
+            result_entry["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results[name] = result_entry
+        print(f"  {name:<28} {seconds:10.4f} s {result_entry['items_per_second'] or 0:14.1f} items/s"
+              + (f" {result_entry['peak_bytes'] / 1e6:10.1f} MB peak" if self.measure_memory else ""))
+        return result
+
+def benchmark_size(size, history_depth, queries, work_dir, measure_memory, seed):
+    '''
+    Run every benchmark on a generated book of size contacts and return the results
+    '''
+    print(f"{size} contacts, history depth {history_depth}:")
+    database_path = os.path.join(work_dir, f"database_{size}.json")
+    write_database(database_path, generate_contacts(size, history_depth, seed))
+    benchmark = Benchmark(measure_memory)
+    generator = random.Random(seed)
+
+    phone_book = PhoneBook()
+    benchmark.run("import_json", lambda: phone_book.import_contacts_from_json(database_path, progress_every=0), size)
+    benchmark.run("export_json", lambda: phone_book.export_contacts_to_json(os.path.join(work_dir, "export.json")), size)
+    benchmark.run("export_json_compact", lambda: phone_book.export_contacts_to_json(os.path.join(work_dir, "export.json"), True), size)
+    snapshot_path = os.path.join(work_dir, "database.snapshot")
+    benchmark.run("export_snapshot", lambda: phone_book.export_contacts_to_snapshot(snapshot_path), size)
+    benchmark.run("import_snapshot", lambda: PhoneBook().import_contacts_from_snapshot(snapshot_path), size)
+
+    contacts = phone_book.contacts
+    # Measure the indexes first, the sample repeats queries so most searches would be answered by the search cache
+    phone_book.search_cache.max_size = 0
+    sample = [generator.choice(contacts) for _ in range(queries)]
+    name_queries = [contact.get_last_name()[:4] for contact in sample]
+    phone_queries = [contact.get_phone_digits()[3:7] for contact in sample]
+    day_queries = [contact.get_create_time().date() for contact in sample]
+    benchmark.run("search_name", lambda: [phone_book.find_contacts_by_name(query) for query in name_queries], queries)
+    benchmark.run("search_phone", lambda: [phone_book.find_contacts_by_phone(query) for query in phone_queries], queries)
+    benchmark.run("search_created_day", lambda: [phone_book.find_contacts_by_date(day, day) for day in day_queries], queries)
+    benchmark.run("search_updated_month", lambda: [phone_book.find_contacts_by_date(day, day + timedelta(days=30), 'update')
+                                                   for day in day_queries], queries)
+    phone_book.search_cache.max_size = SearchCache().max_size
+    benchmark.run("search_name_cached", lambda: [phone_book.find_contacts_by_name(query) for query in name_queries], queries)
+    benchmark.run("search_phone_cached", lambda: [phone_book.find_contacts_by_phone(query) for query in phone_queries], queries)
+
+    for sort_key in SORT_KEYS:
+        benchmark.run(f"sort_{sort_key}_top5", lambda: phone_book.sorted_contacts(sort_key, False, 0, 5))
+        benchmark.run(f"sort_{sort_key}_full", lambda: phone_book.sorted_contacts(sort_key, True), size)
+    benchmark.run("group_counts", phone_book.group_counts)
+    benchmark.run("group_all", phone_book.grouped_contacts, size)
+
+    batch_size = max(size // 100, 10)
+    add_path = os.path.join(work_dir, "add.csv")
+    delete_path = os.path.join(work_dir, "delete.csv")
+    write_csv_files(add_path, delete_path, contacts, batch_size, seed)
+    benchmark.run("batch_add_csv", lambda: phone_book.import_contacts_from_csv(add_path, quiet=True), batch_size)
+    benchmark.run("batch_delete_csv", lambda: phone_book.delete_contacts_from_csv(delete_path, quiet=True), batch_size)
+    return benchmark.results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PhoneBook operations on generated phone books")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="numbers of contacts (default: 10000 100000)")
+    parser.add_argument("--history", type=int, default=3, help="average number of updates per contact (default: 3)")
+    parser.add_argument("--queries", type=int, default=100, help="number of queries per search benchmark (default: 100)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="also measure peak memory with tracemalloc (slower)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    report = {
+        "time": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "history_depth": args.history,
+        "queries": args.queries,
+        "seed": args.seed,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            report["sizes"][str(size)] = benchmark_size(size, args.history, args.queries, work_dir, args.memory, args.seed)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=4)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
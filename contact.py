@@ -1,34 +1,107 @@
 import datetime
+import json
 import logging
+import re
+import sys
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def to_timestamp(value):
+    '''
+    Convert a datetime to the integer number of microseconds since 1970-01-01 used to store times
+    Integers are returned unchanged
+    '''
+    if isinstance(value, int):
+        return value
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+def from_timestamp(value):
+    '''
+    Convert a number of microseconds since 1970-01-01 back to a datetime
+    '''
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+# Fields of a restored contact that can be decoded on first access, see Contact.restore
+LAZY_FIELDS = ('_phone_number', '_phone_digits', '_email_address', '_address')
+
+def encode_history(changes):
+    '''
+    Return the list of change dictionaries changes as compact JSON text, the form a history is kept in until it is accessed
+    '''
+    return json.dumps(changes, separators=(',', ':'))
 
 class Contact:
     '''
     Class to represent a contact in the phone book
+    Times are stored as integer timestamps (see to_timestamp) and decoded to datetime on access
     '''
+    __slots__ = ('_first_name', '_last_name', '_phone_number', '_phone_digits', '_email_address', '_address',
+                 '_create_time', '_update_time', '_history', '_raw_history', '_record', '__weakref__')
     logger = logging.getLogger("phoneBookLogger")
 
     def __init__(self, first_name='', last_name='', phone_number='', email_address='', address='', 
-                 create_time=datetime.datetime.now(), update_time=datetime.datetime.now(), history=[]):
+                 create_time=None, update_time=None, history=None, raw_history=None, log=True):
+        '''
+        history is a list of Change objects. Alternatively raw_history is the list of change dictionaries
+        read from the database, which is kept as compact JSON text (a fraction of the memory of the dictionaries)
+        and only decoded to Change objects when the history is first accessed
+        If log is False, the creation of the contact is not logged (e.g. when loading saved contacts)
+        '''
+        if create_time is None:
+            create_time = datetime.datetime.now()
+        if update_time is None:
+            update_time = create_time
         self._first_name = first_name
         self._last_name = last_name
         self._phone_number = phone_number
+        self._phone_digits = re.sub(r'\D', '', phone_number) # digits-only form used for phone search and sort
         self._email_address = email_address
         self._address = address
-        self._create_time = create_time
-        self._update_time = update_time
-        self._history = history[:] # list of Change objects
-        if not self._history:
+        self._create_time = to_timestamp(create_time)
+        self._update_time = to_timestamp(update_time)
+        if isinstance(raw_history, list) and raw_history:
+            raw_history = encode_history(raw_history)
+        self._raw_history = raw_history or None # JSON text, or the saved record of a restored contact, see get_history
+        self._record = None # saved record the LAZY_FIELDS are decoded from, see restore
+        self._history = None if raw_history else (list(history) if history else []) # list of Change objects
+        if self._history == []:
             message = f'{first_name} {last_name}, {phone_number}, {email_address}, {address}'
             self._history.append(Change('Created', message, '', '', '', self._create_time))
-        self.logger.info(f"Contact added: {first_name} {last_name}, {phone_number}, {email_address}, {address}")
+        if log:
+            self.logger.info(f"Contact added: {first_name} {last_name}, {phone_number}, {email_address}, {address}")
+
+    def __getattr__(self, name):
+        '''
+        Decode the LAZY_FIELDS of a restored contact when one of them is first read
+        Only called for attributes that are not set
+        '''
+        if name not in LAZY_FIELDS or self._record is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        self._load_fields()
+        return getattr(self, name)
+
+    def _load_fields(self):
+        record = self._record
+        if record is not None:
+            self._phone_number, self._phone_digits, self._email_address, self._address = record.fields()
+            self._record = None
+
+    def _uncached_fields(self):
+        '''
+        Return the LAZY_FIELDS without keeping them in the contact if they were not read yet
+        '''
+        record = self._record
+        if record is not None:
+            return record.fields()
+        return self._phone_number, self._phone_digits, self._email_address, self._address
 
     def get_first_name(self):
         return self._first_name
 
     def set_first_name(self, first_name):
         if self._first_name != first_name:
-            self._update_time = datetime.datetime.now()
-            self._history.append(Change('Updated', '', 'First Name', self._first_name, first_name, self._update_time))
+            self._update_time = to_timestamp(datetime.datetime.now())
+            self.get_history().append(Change('Updated', '', 'First Name', self._first_name, first_name, self._update_time))
             print(f"First Name changed from '{self._first_name}' to '{first_name}'")
             self._first_name = first_name
             self.logger.info(f"First Name changed from '{self._first_name}' to '{first_name}'")
@@ -41,8 +114,8 @@ class Contact:
 
     def set_last_name(self, last_name):
         if self._last_name != last_name:
-            self._update_time = datetime.datetime.now()
-            self._history.append(Change('Updated', '', 'Last Name', self._last_name, last_name, self._update_time))
+            self._update_time = to_timestamp(datetime.datetime.now())
+            self.get_history().append(Change('Updated', '', 'Last Name', self._last_name, last_name, self._update_time))
             print(f"Last Name changed from '{self._last_name}' to '{last_name}'")
             self._last_name = last_name
             self.logger.info(f"Last Name changed from '{self._last_name}' to '{last_name}'")
@@ -55,22 +128,26 @@ class Contact:
 
     def set_phone_number(self, phone_number):
         if self._phone_number != phone_number:
-            self._update_time = datetime.datetime.now()
-            self._history.append(Change('Updated', '', 'Phone Number', self._phone_number, phone_number, self._update_time))
+            self._update_time = to_timestamp(datetime.datetime.now())
+            self.get_history().append(Change('Updated', '', 'Phone Number', self._phone_number, phone_number, self._update_time))
             print(f"Phone Number changed from '{self._phone_number}' to '{phone_number}'")
             self._phone_number = phone_number
+            self._phone_digits = re.sub(r'\D', '', phone_number)
             self.logger.info(f"Phone Number changed from '{self._phone_number}' to '{phone_number}'")
         else:
             print("No changes made to Phone Number.")
             self.logger.info("No changes made to Phone Number")
 
+    def get_phone_digits(self):
+        return self._phone_digits
+
     def get_email_address(self):
         return self._email_address
 
     def set_email_address(self, email_address):
         if self._email_address != email_address:
-            self._update_time = datetime.datetime.now()
-            self._history.append(Change('Updated', '', 'Email Address', self._email_address, email_address, self._update_time))
+            self._update_time = to_timestamp(datetime.datetime.now())
+            self.get_history().append(Change('Updated', '', 'Email Address', self._email_address, email_address, self._update_time))
             print(f"Email Address changed from '{self._email_address}' to '{email_address}'")
             self._email_address = email_address
             self.logger.info(f"Email Address changed from '{self._email_address}' to '{email_address}'")
@@ -83,8 +160,8 @@ class Contact:
 
     def set_address(self, address):
         if self._address != address:
-            self._update_time = datetime.datetime.now()
-            self._history.append(Change('Updated', '', 'Address', self._address, address, self._update_time))
+            self._update_time = to_timestamp(datetime.datetime.now())
+            self.get_history().append(Change('Updated', '', 'Address', self._address, address, self._update_time))
             print(f"Address changed from '{self._address}' to '{address}'")
             self._address = address
             self.logger.info(f"Address changed from '{self._address}' to '{address}'")
@@ -93,32 +170,128 @@ class Contact:
             self.logger.info("No changes made to Address")
 
     def get_create_time(self):
-        return self._create_time
+        return from_timestamp(self._create_time)
 
     def get_update_time(self):
+        return from_timestamp(self._update_time)
+
+    def get_create_timestamp(self):
+        return self._create_time
+
+    def get_update_timestamp(self):
         return self._update_time
     
     def get_history(self): 
+        if self._history is None:
+            self._history = self._uncached_history()
+            self._raw_history = None
         return self._history
+
+    def _uncached_history(self):
+        '''
+        Return the history as Change objects without keeping them in the contact if it was not accessed yet
+        '''
+        if self._history is not None:
+            return self._history
+        if isinstance(self._raw_history, str):
+            return [Change.from_dict(change) for change in json.loads(self._raw_history)]
+        return self._raw_history.history()
     
+    def apply_change(self, change):
+        '''
+        Apply a recorded 'Updated' change (e.g. replayed from a journal) without printing
+        Set the changed field and the update time, and append the change to the history
+        '''
+        self._load_fields()
+        if change.get_field() == 'First Name':
+            self._first_name = change.get_new_value()
+        elif change.get_field() == 'Last Name':
+            self._last_name = change.get_new_value()
+        elif change.get_field() == 'Phone Number':
+            self._phone_number = change.get_new_value()
+            self._phone_digits = re.sub(r'\D', '', change.get_new_value())
+        elif change.get_field() == 'Email Address':
+            self._email_address = change.get_new_value()
+        elif change.get_field() == 'Address':
+            self._address = change.get_new_value()
+        self._update_time = change.get_change_timestamp()
+        self.get_history().append(change)
+
+    def has_archived_history(self):
+        '''
+        Check if older changes of this contact were moved to a history archive
+        '''
+        history = self.get_history()
+        return len(history) > 1 and history[1].get_operation() == 'Archived'
+
+    def archivable_changes(self, keep_last=None, keep_since=None):
+        '''
+        Return the changes that can be moved to an archive, oldest first: every change except the first one (the creation),
+        the last keep_last changes and the changes made at or after the timestamp keep_since
+        With both limits, the changes kept by either of them are kept
+        '''
+        history = self.get_history()
+        start = 2 if self.has_archived_history() else 1
+        keep_from = len(history)
+        if keep_last is not None:
+            keep_from = min(keep_from, max(len(history) - keep_last, start))
+        if keep_since is not None:
+            recent = next((position for position in range(start, len(history)) if history[position].get_change_timestamp() >= keep_since), len(history))
+            keep_from = min(keep_from, recent)
+        if keep_last is None and keep_since is None:
+            return []
+        return history[start:keep_from]
+
+    def remove_archived_changes(self, count):
+        '''
+        Remove the count changes returned first by archivable_changes once they are archived
+        They are replaced by an 'Archived' change after the creation, so the history shows that older changes exist
+        '''
+        history = self.get_history()
+        start = 2 if self.has_archived_history() else 1
+        last_archived = history[start + count - 1]
+        marker = Change('Archived', 'Older changes are in the history archive', '', '', '', last_archived.get_change_timestamp())
+        history[1:start + count] = [marker]
+
     def print_history(self):
-        for change in self._history:
+        for change in self.get_history():
             change.print()
 
     def to_dict(self):
+        phone_number, phone_digits, email_address, address = self._uncached_fields()
         return {
             "first_name": self._first_name,
             "last_name": self._last_name,
-            "phone_number": self._phone_number,
-            "email_address": self._email_address,
-            "address": self._address,
-            "create_time": self._create_time.isoformat(),
-            "update_time": self._update_time.isoformat(),
-            "history": [change.to_dict() for change in self._history]
+            "phone_number": phone_number,
+            "email_address": email_address,
+            "address": address,
+            "create_time": from_timestamp(self._create_time).isoformat(),
+            "update_time": from_timestamp(self._update_time).isoformat(),
+            "history": json.loads(self._raw_history) if isinstance(self._raw_history, str)
+                       else [change.to_dict() for change in self._uncached_history()]
         }
 
     @classmethod
-    def from_dict(cls, data):
+    def restore(cls, first_name, last_name, create_time, update_time, record):
+        '''
+        Build a saved contact from its names and timestamps without going through __init__,
+        used to load large numbers of contacts quickly
+        record is the saved record of the contact (e.g. a snapshot.SnapshotRecord): its fields() method returns
+        the LAZY_FIELDS and its history() method the Change objects of the history. They are only called when
+        those are first accessed, the names are needed right away as the phone book indexes them on load
+        '''
+        contact = cls.__new__(cls)
+        contact._first_name = first_name
+        contact._last_name = last_name
+        contact._create_time = create_time
+        contact._update_time = update_time
+        contact._record = record
+        contact._raw_history = record
+        contact._history = None
+        return contact
+
+    @classmethod
+    def from_dict(cls, data, log=True):
         return cls(
             first_name=data["first_name"],
             last_name=data["last_name"],
@@ -127,27 +300,58 @@ class Contact:
             address=data["address"],
             create_time=datetime.datetime.fromisoformat(data["create_time"]),
             update_time=datetime.datetime.fromisoformat(data["update_time"]),
-            history=[Change.from_dict(change) for change in data["history"]]
+            raw_history=data["history"],
+            log=log
         )
 
 class Change:
     '''
     Class to represent a change in a contact
+    Operation and field names are interned so all changes share one copy of each,
+    and the change time is stored as an integer timestamp
     '''
+    __slots__ = ('_operation', '_message', '_field', '_old_value', '_new_value', '_change_time')
+
     def __init__(self, operation='', message='', field='', old_value='', new_value='', 
-                 change_time=datetime.datetime.now()):
-        self._operation = operation
+                 change_time=None):
+        if change_time is None:
+            change_time = datetime.datetime.now()
+        self._operation = sys.intern(operation)
         self._message = message
-        self._field = field
+        self._field = sys.intern(field)
         self._old_value = old_value
         self._new_value = new_value
-        self._change_time = change_time
+        self._change_time = to_timestamp(change_time)
+
+    def get_operation(self):
+        return self._operation
+
+    def get_message(self):
+        return self._message
+
+    def get_field(self):
+        return self._field
+
+    def get_old_value(self):
+        return self._old_value
+
+    def get_new_value(self):
+        return self._new_value
+
+    def get_change_time(self):
+        return from_timestamp(self._change_time)
+
+    def get_change_timestamp(self):
+        return self._change_time
     
     def print(self):
+        change_time = from_timestamp(self._change_time)
         if self._operation == 'Created':
-            print(f'{self._change_time} [{self._operation}] {self._message}')
+            print(f'{change_time} [{self._operation}] {self._message}')
         elif self._operation == 'Updated':
-            print(f"{self._change_time} [{self._operation}] {self._field} from '{self._old_value}' to '{self._new_value}'")
+            print(f"{change_time} [{self._operation}] {self._field} from '{self._old_value}' to '{self._new_value}'")
+        elif self._operation == 'Archived':
+            print(f'{change_time} [{self._operation}] {self._message}')
 
     def to_dict(self):
         return {
@@ -156,7 +360,7 @@ class Change:
             "field": self._field,
             "old_value": self._old_value,
             "new_value": self._new_value,
-            "change_time": self._change_time.isoformat()
+            "change_time": from_timestamp(self._change_time).isoformat()
         }
     
     @classmethod
@@ -0,0 +1,109 @@
+from contact import Change
+import json
+import logging
+import os
+
+def contact_key(contact):
+    '''
+    Return the key identifying a contact in the archive: its create time and creation message
+    Both never change (the first change of a history is never archived), unlike the name
+    '''
+    return f"{contact.get_create_timestamp()} {contact.get_history()[0].get_message()}"
+
+class HistoryArchive:
+    '''
+    Class to represent an append-only archive of the old changes removed from contact histories
+    Each entry is one JSON object per line: {"contact": contact_key, "changes": [change dictionaries]}
+    The offsets of the entries of each contact are indexed when the archive is first read
+    '''
+    logger = logging.getLogger("phoneBookLogger")
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._offsets = None # contact key -> offsets of its entries in the file, None until first read
+
+    def _build_index(self):
+        self._offsets = {}
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'rb') as archive_file:
+            offset = 0
+            for line in archive_file:
+                try:
+                    self._offsets.setdefault(json.loads(line)["contact"], []).append(offset)
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                    # A truncated last entry from a crash in the middle of a write
+                    self.logger.info(f"Ignored malformed history archive entry in {self.file_path}")
+                offset += len(line)
+
+    def _repair_tail(self, archive_file):
+        '''
+        Make the archive end with a complete line before appending to it
+        A partial last entry (e.g. from a crash in the middle of a write) is cut off the file; a last entry that
+        was written but not its line end is kept and its line ended, as _build_index may have indexed it
+        '''
+        size = archive_file.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        archive_file.seek(size - 1)
+        if archive_file.read(1) == b"\n":
+            return
+        # Look for the start of the last line, reading backwards
+        line_start = size
+        while line_start > 0:
+            block_start = max(line_start - 65536, 0)
+            archive_file.seek(block_start)
+            newline = archive_file.read(line_start - block_start).rfind(b"\n")
+            if newline >= 0:
+                line_start = block_start + newline + 1
+                break
+            line_start = block_start
+        archive_file.seek(line_start)
+        try:
+            json.loads(archive_file.read())["contact"]
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+            self.logger.info(f"Ignored malformed history archive entry in {self.file_path}, archive truncated to {line_start} bytes")
+            archive_file.truncate(line_start)
+        else:
+            archive_file.write(b"\n")
+        archive_file.seek(0, os.SEEK_END)
+
+    def append(self, entries):
+        '''
+        Append (contact_key, list of Change) entries to the archive and force them to disk
+        '''
+        if not entries:
+            return
+        with open(self.file_path, 'a+b') as archive_file:
+            self._repair_tail(archive_file)
+            offset = archive_file.tell()
+            for key, changes in entries:
+                line = (json.dumps({"contact": key, "changes": [change.to_dict() for change in changes]}) + "\n").encode('utf-8')
+                archive_file.write(line)
+                if self._offsets is not None:
+                    self._offsets.setdefault(key, []).append(offset)
+                offset += len(line)
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+
+    def changes(self, contact):
+        '''
+        Return the archived changes of a contact, oldest first
+        A change archived twice (if the phone book was not saved after archiving) is only returned once
+        '''
+        if self._offsets is None:
+            self._build_index()
+        offsets = self._offsets.get(contact_key(contact))
+        if not offsets:
+            return []
+        changes = []
+        seen = set()
+        with open(self.file_path, 'rb') as archive_file:
+            for offset in offsets:
+                archive_file.seek(offset)
+                for change in json.loads(archive_file.readline())["changes"]:
+                    change_id = tuple(change.values())
+                    if change_id not in seen:
+                        seen.add(change_id)
+                        changes.append(Change.from_dict(change))
+        return changes
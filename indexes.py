@@ -0,0 +1,346 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import logging
+import threading
+
+def levenshtein(a, b):
+    '''
+    Return the edit distance between two strings: the number of inserted, deleted or replaced characters
+    '''
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+class SubstringIndex:
+    '''
+    Class to index strings by their n-grams so that substring queries
+    do not have to scan and rebuild every string
+    '''
+    def __init__(self, n=3):
+        '''
+        Initialize an empty index of n-grams of length n
+        '''
+        self.n = n
+        self._postings = defaultdict(set) # n-gram -> set of items whose key contains it
+        self._entries = {} # item -> (order, key)
+        self.last_scanned = 0 # number of keys compared by the last search
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, item, key, order):
+        '''
+        Index an item under the given key
+        order is used to return search results in a stable order
+        '''
+        if item in self._entries:
+            self.remove(item)
+        self._entries[item] = (order, key)
+        for gram in self._grams(key):
+            self._postings[gram].add(item)
+
+    def remove(self, item):
+        '''
+        Remove an item from the index, do nothing if it is not indexed
+        '''
+        entry = self._entries.pop(item, None)
+        if entry is None:
+            return
+        for gram in self._grams(entry[1]):
+            items = self._postings.get(gram)
+            if items is not None:
+                items.discard(item)
+                if not items:
+                    del self._postings[gram]
+
+    def clear(self):
+        self._postings.clear()
+        self._entries.clear()
+
+    def search(self, query):
+        '''
+        Return the items whose key contains query, ordered by their order value
+        Queries shorter than n are checked against the stored keys directly
+        '''
+        if len(query) < self.n:
+            matches = [item for item, (order, key) in self._entries.items() if query in key]
+        else:
+            postings = sorted((self._postings.get(gram, set()) for gram in self._grams(query)), key=len)
+            candidates = set(postings[0])
+            for items in postings[1:]:
+                candidates &= items
+                if not candidates:
+                    break
+            matches = [item for item in candidates if query in self._entries[item][1]]
+        self.last_scanned = len(self._entries) if len(query) < self.n else len(candidates)
+        matches.sort(key=lambda item: self._entries[item][0])
+        return matches
+
+class SortedIndex:
+    '''
+    Class to keep items sorted by a key so that range queries and ordered
+    listings can be answered with binary search instead of a full scan
+    '''
+    def __init__(self):
+        self._keys = [] # sorted list of (key, order)
+        self._items = [] # items, parallel to self._keys
+        self._entries = {} # item -> (key, order)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def add(self, item, key, order):
+        '''
+        Insert an item at its sorted position
+        order breaks ties between equal keys
+        '''
+        if item in self._entries:
+            self.remove(item)
+        entry = (key, order)
+        position = bisect_right(self._keys, entry)
+        self._keys.insert(position, entry)
+        self._items.insert(position, item)
+        self._entries[item] = entry
+
+    def remove(self, item):
+        '''
+        Remove an item from the index, do nothing if it is not indexed
+        '''
+        entry = self._entries.pop(item, None)
+        if entry is None:
+            return
+        position = bisect_left(self._keys, entry)
+        del self._keys[position]
+        del self._items[position]
+
+    def clear(self):
+        self._keys.clear()
+        self._items.clear()
+        self._entries.clear()
+
+    def build(self, entries):
+        '''
+        Replace the contents of the index with (item, key, order) entries using a single sort,
+        which is much faster than inserting a large number of items one by one
+        '''
+        self._entries = {item: (key, order) for item, key, order in entries}
+        ordered = sorted(self._entries.items(), key=lambda entry: entry[1])
+        self._keys = [entry for item, entry in ordered]
+        self._items = [item for item, entry in ordered]
+
+    def range(self, low, high):
+        '''
+        Return the items whose key is between low and high (inclusively), in key order
+        '''
+        start = bisect_left(self._keys, (low,))
+        end = bisect_right(self._keys, (high, float('inf')))
+        return self._items[start:end]
+
+class BKTree:
+    '''
+    Class to index strings in a BK-tree so that the keys within an edit distance of a query
+    are found without computing the distance to every key
+    Items with the same key share one node, so the tree only grows with the number of distinct keys
+    '''
+    def __init__(self):
+        self._root = None # node: [key, set of items, {distance to key: child node}]
+        self._nodes = {} # key -> node, a node stays in the tree after its last item is removed
+        self._entries = {} # item -> (order, key)
+        self.last_scanned = 0 # number of keys compared by the last search
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, item, key, order):
+        '''
+        Index an item under the given key
+        order is used to return search results in a stable order
+        '''
+        if item in self._entries:
+            self.remove(item)
+        self._entries[item] = (order, key)
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._insert(key)
+        node[1].add(item)
+
+    def _insert(self, key):
+        node = [key, set(), {}]
+        self._nodes[key] = node
+        if self._root is None:
+            self._root = node
+            return node
+        parent = self._root
+        while True:
+            distance = levenshtein(key, parent[0])
+            child = parent[2].get(distance)
+            if child is None:
+                parent[2][distance] = node
+                return node
+            parent = child
+
+    def remove(self, item):
+        '''
+        Remove an item from the index, do nothing if it is not indexed
+        '''
+        entry = self._entries.pop(item, None)
+        if entry is not None:
+            self._nodes[entry[1]][1].discard(item)
+
+    def clear(self):
+        self._root = None
+        self._nodes.clear()
+        self._entries.clear()
+
+    def order(self, item):
+        return self._entries[item][0]
+
+    def search(self, query, max_distance):
+        '''
+        Return (item, distance) pairs for the items whose key is within max_distance of query,
+        ordered by distance and then by order
+        Only the subtrees that can hold such keys (by the triangle inequality) are visited
+        '''
+        matches = []
+        self.last_scanned = 0
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            key, items, children = stack.pop()
+            distance = levenshtein(query, key)
+            self.last_scanned += 1
+            if distance <= max_distance:
+                matches.extend((item, distance) for item in items)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: (match[1], self._entries[match[0]][0]))
+        return matches
+
+class FuzzyNameIndex:
+    '''
+    Class to find items by first, last or full name when the query may contain typos
+    First and last names are kept in two BK-trees of distinct names, and a full name query is matched by
+    splitting it at a space into a first name part and a last name part, whose distances are added up
+    '''
+    def __init__(self):
+        self._first_names = BKTree()
+        self._last_names = BKTree()
+        self.last_scanned = 0 # number of names compared by the last search
+
+    def __len__(self):
+        return len(self._first_names)
+
+    def add(self, item, first_name, last_name, order):
+        '''
+        Index an item under its lowercased first and last name
+        '''
+        self._first_names.add(item, first_name.lower(), order)
+        self._last_names.add(item, last_name.lower(), order)
+
+    def remove(self, item):
+        self._first_names.remove(item)
+        self._last_names.remove(item)
+
+    def clear(self):
+        self._first_names.clear()
+        self._last_names.clear()
+
+    def search(self, query, max_distance):
+        '''
+        Return (item, distance) pairs for the items whose first, last or full name is within max_distance
+        edits of query (lowercased, whitespace collapsed), closest first and then by order
+        An item matched in several ways gets its smallest distance
+        '''
+        query = ' '.join(query.lower().split())
+        distances = {}
+        self.last_scanned = 0
+
+        def merge(matches):
+            for item, distance in matches:
+                if distance < distances.get(item, max_distance + 1):
+                    distances[item] = distance
+
+        merge(self._search(self._first_names, query, max_distance))
+        merge(self._search(self._last_names, query, max_distance))
+        words = query.split(' ')
+        for split in range(1, len(words)):
+            first_distances = dict(self._search(self._first_names, ' '.join(words[:split]), max_distance))
+            if first_distances:
+                last_matches = self._search(self._last_names, ' '.join(words[split:]), max_distance)
+                merge((item, first_distances[item] + distance) for item, distance in last_matches if item in first_distances)
+        return sorted(distances.items(), key=lambda match: (match[1], self._first_names.order(match[0])))
+
+    def _search(self, tree, query, max_distance):
+        matches = tree.search(query, max_distance)
+        self.last_scanned += tree.last_scanned
+        return matches
+
+class IndexBuilder:
+    '''
+    Class to build indexes one after the other in a background thread, from a list of (item, order) pairs
+    Each index is handed over once by result(); stop() ends the build within a few items
+    '''
+    logger = logging.getLogger("phoneBookLogger")
+
+    def __init__(self, items, builds):
+        '''
+        Start building the indexes of builds, a list of (name, function building the index from an iterable of items)
+        '''
+        self._items = items
+        self._builds = builds
+        self._indexes = {} # name -> index built and not handed over yet
+        self._done = {name: threading.Event() for name, build in builds}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="index-builder", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for name, build in self._builds:
+            if not self._stopped:
+                try:
+                    self._indexes[name] = build(self._iter_items())
+                except StopBuilding:
+                    pass
+                except Exception:
+                    self.logger.exception(f"Could not build the {name} index in the background")
+            self._done[name].set()
+
+    def _iter_items(self):
+        for count, item in enumerate(self._items):
+            if count % 1000 == 0 and self._stopped:
+                raise StopBuilding()
+            yield item
+
+    def result(self, name):
+        '''
+        Wait for the index name to be built and return it, or None if this builder does not build it, failed or was stopped
+        '''
+        done = self._done.get(name)
+        if done is None:
+            return None
+        done.wait()
+        return self._indexes.pop(name, None)
+
+    def stop(self):
+        '''
+        Stop building and wait for the thread to end, the indexes already built can still be taken with result()
+        '''
+        self._stopped = True
+        self._thread.join()
+
+class StopBuilding(Exception):
+    '''
+    Raised in the thread of an IndexBuilder to abandon the index being built
+    '''
@@ -0,0 +1,171 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from tabulate import tabulate
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last bucket holds everything slower
+LATENCY_BUCKETS = [0.0001, 0.001, 0.01, 0.1, 1, 10]
+LATENCY_LABELS = ["<0.1ms", "<1ms", "<10ms", "<100ms", "<1s", "<10s", ">=10s"]
+
+class OperationStats:
+    '''
+    Class to represent the statistics collected for one kind of operation
+    '''
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1) # number of calls per latency bucket
+        self.rows_scanned = 0
+        self.rows_matched = 0
+        self.peak_memory = 0 # largest memory peak of one call in bytes, only measured when memory tracing is on
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "total_seconds": self.total_seconds,
+            "mean_seconds": self.total_seconds / self.calls if self.calls else 0,
+            "max_seconds": self.max_seconds,
+            "latency_histogram": dict(zip(LATENCY_LABELS, self.histogram)),
+            "rows_scanned": self.rows_scanned,
+            "rows_matched": self.rows_matched,
+            "peak_memory": self.peak_memory,
+        }
+
+class Measurement:
+    '''
+    Class to represent one operation being measured, code inside the operation adds the rows it scanned and matched
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.rows_scanned = 0
+        self.rows_matched = 0
+
+class Instrumentation:
+    '''
+    Class to collect call counts, latency histograms, rows scanned/matched and optionally memory peaks per operation
+    Operations can be measured from several threads, each thread has its own stack of running measurements
+    '''
+    def __init__(self):
+        self.operations = {} # operation name -> OperationStats
+        self.trace_memory = False
+        self._local = threading.local() # per thread: active, the measurements running in the thread, innermost last
+        self._lock = threading.Lock() # held while the statistics of an operation are updated
+
+    @property
+    def _active(self):
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = []
+        return active
+
+    def set_memory_tracing(self, enabled):
+        '''
+        Turn memory peak measurement with tracemalloc on or off (it slows down every operation)
+        '''
+        self.trace_memory = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def measure(self, name):
+        '''
+        Measure the operation run inside the with block under the given name
+        '''
+        measurement = Measurement(name)
+        active = self._active
+        outermost = not active
+        active.append(measurement)
+        if self.trace_memory and outermost:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield measurement
+        finally:
+            seconds = time.perf_counter() - start
+            active.pop()
+            with self._lock:
+                stats = self.operations.get(name)
+                if stats is None:
+                    stats = self.operations[name] = OperationStats()
+                stats.calls += 1
+                stats.total_seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds)
+                stats.histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+                stats.rows_scanned += measurement.rows_scanned
+                stats.rows_matched += measurement.rows_matched
+                if self.trace_memory and outermost and tracemalloc.is_tracing():
+                    stats.peak_memory = max(stats.peak_memory, tracemalloc.get_traced_memory()[1] - memory_start)
+
+    def is_measuring(self, name):
+        '''
+        Check if the innermost operation being measured is name
+        '''
+        active = self._active
+        return bool(active) and active[-1].name == name
+
+    def count_rows(self, scanned=0, matched=0):
+        '''
+        Add rows scanned and matched to the innermost operation being measured
+        '''
+        active = self._active
+        if active:
+            active[-1].rows_scanned += scanned
+            active[-1].rows_matched += matched
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
+
+    def report(self):
+        '''
+        Return the statistics of every operation as a table
+        '''
+        headers = ["Operation", "Calls", "Total (s)", "Mean (ms)", "Max (ms)"] + LATENCY_LABELS + ["Scanned", "Matched"]
+        if self.trace_memory:
+            headers.append("Peak memory (KB)")
+        rows = []
+        with self._lock:
+            operations = sorted(self.operations.items())
+        for name, stats in operations:
+            row = [name, stats.calls, f"{stats.total_seconds:.4f}", f"{stats.total_seconds / stats.calls * 1000:.3f}",
+                   f"{stats.max_seconds * 1000:.3f}"] + stats.histogram + [stats.rows_scanned, stats.rows_matched]
+            if self.trace_memory:
+                row.append(f"{stats.peak_memory / 1024:.1f}")
+            rows.append(row)
+        return tabulate(rows, headers=headers, tablefmt="grid")
+
+    def dump(self, file_path):
+        '''
+        Write the statistics of every operation to a JSON file
+        '''
+        with self._lock:
+            operations = {name: stats.to_dict() for name, stats in sorted(self.operations.items())}
+        with open(file_path, 'w') as json_file:
+            json.dump(operations, json_file, indent=4)
+
+def instrumented(name):
+    '''
+    Decorator measuring a PhoneBook method as the operation name in self.stats
+    If the method returns a list, its length is counted as the rows matched
+    An overriding method calling the method it overrides is measured once
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.stats.is_measuring(name):
+                return method(self, *args, **kwargs)
+            with self.stats.measure(name) as measurement:
+                result = method(self, *args, **kwargs)
+                if isinstance(result, list):
+                    measurement.rows_matched += len(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+class JournalLockedError(RuntimeError):
+    '''
+    Raised when a journal is already open in another process
+    '''
+
+class Journal:
+    '''
+    Class to represent an append-only journal of phone book operations
+    Each record is one JSON object per line, written as soon as the operation happens
+    '''
+    logger = logging.getLogger("phoneBookLogger")
+
+    def __init__(self, file_path, fsync=False):
+        '''
+        Open the journal for appending
+        Raise JournalLockedError if another process has it open
+        If fsync is True, every record is forced to disk before append returns
+        '''
+        self.file_path = file_path
+        self.fsync = fsync
+        self.count = 0 # number of records in the journal file
+        self.damaged = False # True if records found after a malformed one were left unreplayed, see records
+        self._file = open(file_path, 'a', encoding='utf-8')
+        try:
+            self._lock()
+        except OSError:
+            self._file.close()
+            raise JournalLockedError(f"{file_path} is in use by another process (the menu, a batch command or the service)")
+
+    def _lock(self):
+        '''
+        Take an exclusive lock on the journal file, held until it is closed
+        Each process saves the phone book from its own memory when compacting the journal,
+        so two processes sharing a journal would overwrite each other's changes
+        '''
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def records(self):
+        '''
+        Yield the records stored in the journal file
+        A truncated or malformed last record (e.g. from a crash in the middle of a write) is cut off the file,
+        so that the next records are not appended to the end of a broken line
+        A malformed record followed by other records is damage, not a torn write: the replay stops there,
+        the file is left as it is and damaged is set, so that the caller can save a copy before compacting it
+        '''
+        self._file.flush()
+        good_end = 0 # offset just after the last readable record
+        line_ended = True
+        with open(self.file_path, 'rb') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    if any(rest.strip() for rest in journal_file):
+                        self.damaged = True
+                        self.logger.warning(f"Malformed journal record at byte {good_end} of {self.file_path}, "
+                                            "the records after it were not replayed")
+                    else:
+                        self.logger.info(f"Ignored malformed journal record in {self.file_path}, journal truncated to {good_end} bytes")
+                        os.truncate(self.file_path, good_end)
+                    return
+                good_end += len(line)
+                line_ended = line.endswith(b"\n")
+                yield record
+        if not line_ended:
+            # The last record was written but not its line end
+            self._file.write("\n")
+            self._file.flush()
+
+    @property
+    def size(self):
+        '''
+        Size of the journal file in bytes
+        '''
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def append(self, record, sync=False):
+        '''
+        Append a record to the journal
+        If sync is True the record is forced to disk even when fsync is False
+        '''
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync or sync:
+            os.fsync(self._file.fileno())
+        self.count += 1
+
+    def truncate(self):
+        '''
+        Remove all records, called once they are saved in a snapshot
+        '''
+        self._file.truncate(0)
+        self._file.flush()
+        self.count = 0
+        self.damaged = False
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,103 @@
+import json
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+# Characters that can continue a JSON number
+NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+def is_ndjson_path(file_path):
+    '''
+    Check if a file path uses the newline-delimited JSON variant of the database format
+    '''
+    return file_path.lower().endswith(NDJSON_EXTENSIONS)
+
+def iter_json_array(json_file, chunk_size=1 << 16):
+    '''
+    Yield the elements of a top-level JSON array one at a time
+    The file is read in chunks, so only the element being decoded is held in memory
+    Raise json.JSONDecodeError if the file is not a valid JSON array
+    '''
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def skip_whitespace():
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            buffer, pos = json_file.read(chunk_size), 0
+            eof = buffer == ''
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+
+    expect_element = True # False once an element was read and a ',' or ']' must follow
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise json.JSONDecodeError("Unterminated array", buffer, pos)
+        if buffer[pos] == ']' and (first or not expect_element):
+            return
+        if not expect_element:
+            if buffer[pos] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
+            expect_element = True
+            continue
+
+        # Decode the next element, reading more of the file while the element is incomplete
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                # A number cut by the end of a chunk decodes as a shorter number ('1' of '1.5'),
+                # it is complete once the next character cannot continue it
+                if eof or (end < len(buffer) and not (type(element) in (int, float) and buffer[end] in NUMBER_CHARS)):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            chunk = json_file.read(chunk_size)
+            eof = chunk == ''
+            buffer = buffer[pos:] + chunk
+            pos = 0
+        pos = end
+        first = False
+        expect_element = False
+        yield element
+
+def iter_ndjson(json_file):
+    '''
+    Yield the JSON value on each non-empty line of a newline-delimited JSON file
+    '''
+    for line in json_file:
+        if line.strip():
+            yield json.loads(line)
+
+def write_json_array(json_file, elements, indent=4):
+    '''
+    Write elements to an open file as a JSON array, one element at a time, so the whole array is never held in memory
+    With indent the output is identical to json.dump(list(elements), json_file, indent=indent),
+    with indent=None it is written without any whitespace
+    '''
+    if indent is None:
+        opening, separator, closing = '[', ',', ']'
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+    else:
+        padding = ' ' * indent
+        opening, separator, closing = '[\n' + padding, ',\n' + padding, '\n]'
+        encoder = json.JSONEncoder(indent=indent)
+        # JSON strings cannot contain raw newlines, so every newline of an encoded element starts a line to indent
+        encode = lambda element: encoder.encode(element).replace('\n', '\n' + padding)
+    empty = True
+    for element in elements:
+        json_file.write(opening if empty else separator)
+        json_file.write(encode(element))
+        empty = False
+    json_file.write('[]' if empty else closing)
@@ -0,0 +1,139 @@
+from benchmark import FIRST_NAMES, LAST_NAMES, STREETS
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import time
+
+class ServiceClient:
+    '''
+    Class to send requests to a running phone book service (see service.py) over one connection
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path, limit=1 << 24)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=1 << 24)
+        return cls(reader, writer)
+
+    async def request(self, op, **fields):
+        '''
+        Send one request and return its response dictionary
+        '''
+        self.next_id += 1
+        self.writer.write((json.dumps({"id": self.next_id, "op": op, **fields}) + "\n").encode('utf-8'))
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("The service closed the connection")
+        return json.loads(line)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def make_request(generator, names, write_ratio):
+    '''
+    Return a random (op, fields) request: mostly searches, sorts and groups, and a write_ratio share of address updates
+    '''
+    if generator.random() < write_ratio:
+        return "update", {"name": generator.choice(names),
+                          "fields": {"address": f"{generator.randint(1, 9999)} {generator.choice(STREETS)}"}}
+    kind = generator.randrange(6)
+    if kind == 0:
+        return "search", {"type": "name", "query": generator.choice(LAST_NAMES)[:4]}
+    if kind == 1:
+        return "search", {"type": "phone", "query": str(generator.randint(200, 999))}
+    if kind == 2:
+        name = generator.choice(FIRST_NAMES)
+        position = generator.randrange(len(name))
+        return "search", {"type": "fuzzy", "query": name[:position] + name[position + 1:]} # one letter missing
+    if kind == 3:
+        return "sort", {"key": generator.choice(["first_name", "last_name", "create_time"]), "stop": 10}
+    if kind == 4:
+        return "group", {}
+    return "group", {"letter": generator.choice(LAST_NAMES)[0]}
+
+async def run_client(client_number, args, names, latencies, errors):
+    generator = random.Random(args.seed + client_number)
+    client = await ServiceClient.connect(args.host, args.port, args.unix)
+    try:
+        for _ in range(args.requests):
+            op, fields = make_request(generator, names, args.write_ratio)
+            start = time.perf_counter()
+            response = await client.request(op, **fields)
+            latencies.append(time.perf_counter() - start)
+            if response["status"] != "ok":
+                errors.append(response["error"])
+    finally:
+        await client.close()
+
+async def load_test(args):
+    '''
+    Run args.clients concurrent clients sending args.requests requests each and return the report
+    '''
+    client = await ServiceClient.connect(args.host, args.port, args.unix)
+    response = await client.request("sort", key="create_time", stop=1000)
+    await client.close()
+    names = [f"{contact['first_name']} {contact['last_name']}" for contact in response["result"]["contacts"]]
+    if not names and args.write_ratio > 0:
+        raise SystemExit("The phone book is empty, there are no contacts to update")
+
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(number, args, names, latencies, errors) for number in range(args.clients)))
+    seconds = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        "time": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "clients": args.clients,
+        "requests": len(latencies),
+        "write_ratio": args.write_ratio,
+        "errors": len(errors),
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(latencies) / seconds, 1),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3),
+            "p50": round(percentiles[49] * 1000, 3),
+            "p90": round(percentiles[89] * 1000, 3),
+            "p99": round(percentiles[98] * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput and latency of a running phone book service (service.py)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="SOCKET_PATH", help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--clients", type=int, default=50, help="number of concurrent connections (default: 50)")
+    parser.add_argument("--requests", type=int, default=200, help="number of requests per connection (default: 200)")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of requests that update a contact (default: 0.1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file the report is also written to")
+    args = parser.parse_args()
+
+    report = asyncio.run(load_test(args))
+    latency = report["latency_ms"]
+    print(f"{report['requests']} requests from {report['clients']} clients in {report['seconds']} s: "
+          f"{report['requests_per_second']} requests/s, {report['errors']} errors")
+    print(f"Latency (ms): mean {latency['mean']}, p50 {latency['p50']}, p90 {latency['p90']}, "
+          f"p99 {latency['p99']}, max {latency['max']}")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4)
+
+if __name__ == "__main__":
+    main()
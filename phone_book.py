@@ -1,12 +1,47 @@
-from contact import Contact
+from atomic_file import atomic_write, file_identity
+from batch_import import CHUNK_SIZE, validated_rows
+from contact import Change, Contact, to_timestamp
+from history_archive import contact_key
+from indexes import FuzzyNameIndex, IndexBuilder, SortedIndex, SubstringIndex
+from instrumentation import Instrumentation, instrumented
+from journal import Journal
+from json_stream import is_ndjson_path, iter_json_array, iter_ndjson, write_json_array
+from search_cache import SearchCache, cached_search
+from snapshot import read_snapshot, write_snapshot
+from table_renderer import PAGE_SIZE, PagedSequence, page_through
 from tabulate import tabulate
+import validation
 import csv
+import functools
+import heapq
 import json
+import os
 import re
+import shutil
 from collections import defaultdict
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
 import logging
 
+# Key functions used to sort contacts, by sort key name
+SORT_KEYS = {
+    'first_name': lambda contact: contact.get_first_name().lower(),
+    'last_name': lambda contact: contact.get_last_name().lower(),
+    'phone_number': lambda contact: int(contact.get_phone_digits() or 0),
+    'create_time': lambda contact: contact.get_create_timestamp(),
+    'update_time': lambda contact: contact.get_update_timestamp(),
+}
+
+# Functions returning the normalized query of each cached search (see search_cache.cached_search) from its arguments,
+# searches with the same normalized query have the same results
+SEARCH_KEYS = {
+    'name': lambda phone_book, query: phone_book.compact_name(query),
+    'phone': lambda phone_book, query: re.sub(r'\D', '', query),
+    'fuzzy_name': lambda phone_book, query, max_distance=None: (
+        ' '.join(query.lower().split()), phone_book.fuzzy_max_distance(query.strip()) if max_distance is None else max_distance),
+    'date': lambda phone_book, start_date, end_date, field='create': (start_date, end_date, field),
+}
+
 class PhoneBook:
     '''
     Class to represent a phone book that stores contacts
@@ -16,8 +51,436 @@ class PhoneBook:
     def __init__(self):
         ''' 
         Initialize the PhoneBook object with an empty list to store contacts
+        and the indexes used to look contacts up without scanning the list
         '''
         self.contacts = []
+        self._name_index = {} # normalized "first last" -> Contact
+        # The indexes below are built when they are first needed (see _rebuild_indexes), None until then
+        self._partial_name_index = None # SubstringIndex of the whitespace-stripped lowercase full names
+        self._partial_phone_index = None # SubstringIndex of the digits of the phone numbers
+        self._fuzzy_name_index = None # FuzzyNameIndex of first, last and full names
+        self._sorted_indexes = {} # key of SORT_KEYS -> SortedIndex of the contacts
+        self._letter_buckets = defaultdict(set) # first letter of the last name -> set of contacts, see group_letter
+        self._order = {} # Contact -> insertion sequence, used to keep search results in a stable order
+        self._next_order = 0
+        self._index_builder = None # IndexBuilder of the lazy indexes, see build_indexes_in_background
+        self._journal = None # Journal of the operations made since the last snapshot, see open_journal
+        self._snapshot_path = None
+        self._binary_snapshot_path = None
+        self._snapshot_size = 0 # size of the snapshot file when it was last read or written
+        self.compact_ratio = 0.5 # the snapshot is rewritten once the journal grows past this fraction of its size...
+        self.compact_min_size = 1 << 20 # ...and past this number of bytes
+        self._batch_depth = 0 # number of journal_batch blocks running, compaction waits for the outermost one
+        self.stats = Instrumentation() # call counts, latencies and rows scanned/matched per operation
+        self.history_archive = None # HistoryArchive holding the changes moved out by archive_histories
+        self.search_cache = SearchCache() # results of the most recent searches, see cached_search
+        self._generation = 0 # number of changes made to the contacts, invalidates the search cache
+
+    def normalize_name(self, first_name, last_name):
+        '''
+        Return the key used to identify a contact: lowercased "first last"
+        '''
+        return f"{first_name.lower()} {last_name.lower()}"
+
+    def compact_name(self, name):
+        '''
+        Return the key used for partial name matching: lowercased with all whitespace removed
+        '''
+        return ''.join(name.lower().split())
+
+    def fuzzy_max_distance(self, query):
+        '''
+        Return the largest edit distance accepted for a fuzzy name query, so that short queries stay precise
+        '''
+        if len(query) < 2:
+            return 0
+        return 1 if len(query) < 4 else 2
+
+    def group_letter(self, last_name):
+        '''
+        Return the group of a contact: the uppercase first letter of the last name, or '#' if it is empty
+        '''
+        return last_name[:1].upper() or '#'
+
+    def _contacts_changed(self):
+        '''
+        Record that contacts were added, changed or removed, so the cached search results are not used any more
+        '''
+        self._generation += 1
+
+    def _index_contact(self, contact):
+        '''
+        Add a contact to all lookup indexes
+        '''
+        self._stop_background_indexes()
+        self._contacts_changed()
+        if contact not in self._order:
+            self._order[contact] = self._next_order
+            self._next_order += 1
+        self._add_to_lookup_indexes(contact)
+        for name, index in self._sorted_indexes.items():
+            index.add(contact, SORT_KEYS[name](contact), self._order[contact])
+
+    def _add_to_lookup_indexes(self, contact):
+        '''
+        Add a contact to the indexes that do not keep contacts sorted
+        '''
+        first_name, last_name = contact.get_first_name(), contact.get_last_name()
+        self._name_index[self.normalize_name(first_name, last_name)] = contact
+        if self._partial_name_index is not None:
+            self._add_to_partial_indexes(self._partial_name_index, self._partial_phone_index, contact, self._order[contact])
+        self._letter_buckets[self.group_letter(last_name)].add(contact)
+        if self._fuzzy_name_index is not None:
+            self._fuzzy_name_index.add(contact, first_name, last_name, self._order[contact])
+
+    def _add_to_partial_indexes(self, name_index, phone_index, contact, order):
+        name_index.add(contact, self.compact_name(f"{contact.get_first_name()} {contact.get_last_name()}"), order)
+        phone_index.add(contact, contact.get_phone_digits(), order)
+
+    def _build_partial_indexes(self, items):
+        name_index, phone_index = SubstringIndex(), SubstringIndex()
+        for contact, order in items:
+            self._add_to_partial_indexes(name_index, phone_index, contact, order)
+        return name_index, phone_index
+
+    def _build_fuzzy_index(self, items):
+        fuzzy_index = FuzzyNameIndex()
+        for contact, order in items:
+            fuzzy_index.add(contact, contact.get_first_name(), contact.get_last_name(), order)
+        return fuzzy_index
+
+    def _build_sorted_index(self, sort_key, items):
+        view = SortedIndex()
+        view.build((contact, SORT_KEYS[sort_key](contact), order) for contact, order in items)
+        return view
+
+    def _background_index(self, name):
+        '''
+        Return the index name built by build_indexes_in_background, waiting for it if it is still being built,
+        or None if it is not built in the background
+        '''
+        builder = self._index_builder
+        return None if builder is None else builder.result(name)
+
+    def _partial_indexes(self):
+        '''
+        Return the partial name and phone indexes, building them on first use
+        Lazy indexes are only stored once complete, so code finding one that is not None never sees it half built
+        '''
+        if self._partial_name_index is None:
+            indexes = self._background_index('partial')
+            if indexes is None:
+                indexes = self._build_partial_indexes(self._order.items())
+            self._partial_phone_index = indexes[1]
+            self._partial_name_index = indexes[0]
+        return self._partial_name_index, self._partial_phone_index
+
+    def _fuzzy_index(self):
+        '''
+        Return the fuzzy name index, building it on first use
+        '''
+        if self._fuzzy_name_index is None:
+            fuzzy_index = self._background_index('fuzzy')
+            if fuzzy_index is None:
+                fuzzy_index = self._build_fuzzy_index(self._order.items())
+            self._fuzzy_name_index = fuzzy_index
+        return self._fuzzy_name_index
+
+    def _sorted_index(self, sort_key):
+        '''
+        Return the sorted view of sort_key, building it on first use with one sort
+        '''
+        view = self._sorted_indexes.get(sort_key)
+        if view is None:
+            view = self._background_index(sort_key)
+            if view is None:
+                view = self._build_sorted_index(sort_key, self._order.items())
+            self._sorted_indexes[sort_key] = view
+        return view
+
+    def build_indexes_in_background(self):
+        '''
+        Start building the partial, sorted and fuzzy indexes in a background thread, e.g. right after loading
+        a large phone book, so that the first search or sort of an interactive session does not wait for them
+        A search needing an index that is still being built waits for it. The indexes are built from the contacts
+        as they are now: a change to the contacts stops the build, and the indexes it did not finish are built
+        by the first search needing them as usual
+        '''
+        self._stop_background_indexes()
+        builds = []
+        if self._partial_name_index is None:
+            builds.append(('partial', self._build_partial_indexes))
+        # The views of the date searches first, then the other sort keys
+        for sort_key in sorted(SORT_KEYS, key=lambda sort_key: sort_key not in ('create_time', 'update_time')):
+            if sort_key not in self._sorted_indexes:
+                builds.append((sort_key, functools.partial(self._build_sorted_index, sort_key)))
+        if self._fuzzy_name_index is None:
+            builds.append(('fuzzy', self._build_fuzzy_index))
+        self._index_builder = IndexBuilder(list(self._order.items()), builds)
+
+    def _stop_background_indexes(self):
+        '''
+        Stop build_indexes_in_background and store the indexes it finished
+        Called before the contacts change, so they never change while the builder thread reads them
+        '''
+        builder = self._index_builder
+        if builder is None:
+            return
+        builder.stop()
+        self._index_builder = None
+        # The contacts did not change since the build started, the finished indexes are up to date
+        indexes = builder.result('partial')
+        if indexes is not None and self._partial_name_index is None:
+            self._partial_phone_index = indexes[1]
+            self._partial_name_index = indexes[0]
+        fuzzy_index = builder.result('fuzzy')
+        if fuzzy_index is not None and self._fuzzy_name_index is None:
+            self._fuzzy_name_index = fuzzy_index
+        for sort_key in SORT_KEYS:
+            view = builder.result(sort_key)
+            if view is not None and sort_key not in self._sorted_indexes:
+                self._sorted_indexes[sort_key] = view
+
+    def _unindex_contact(self, contact):
+        '''
+        Remove a contact from all lookup indexes
+        '''
+        self._stop_background_indexes()
+        key = self.normalize_name(contact.get_first_name(), contact.get_last_name())
+        if self._name_index.get(key) is contact:
+            del self._name_index[key]
+        if self._partial_name_index is not None:
+            self._partial_name_index.remove(contact)
+            self._partial_phone_index.remove(contact)
+        if self._fuzzy_name_index is not None:
+            self._fuzzy_name_index.remove(contact)
+        letter = self.group_letter(contact.get_last_name())
+        bucket = self._letter_buckets.get(letter)
+        if bucket is not None:
+            bucket.discard(contact)
+            if not bucket:
+                del self._letter_buckets[letter]
+        for index in self._sorted_indexes.values():
+            index.remove(contact)
+
+    def _forget_contact(self, contact):
+        '''
+        Remove a deleted contact from the indexes and the insertion order
+        '''
+        self._contacts_changed()
+        self._unindex_contact(contact)
+        self._order.pop(contact, None)
+
+    def _rebuild_indexes(self):
+        '''
+        Rebuild the name index and the groups from self.contacts
+        The partial, fuzzy and sorted indexes are dropped and built again by the first search or sort that needs them,
+        so loading a large phone book does not pay for indexes the session may never use
+        (unless build_indexes_in_background is called after loading)
+        '''
+        self._stop_background_indexes()
+        self._contacts_changed()
+        self._name_index = {}
+        self._partial_name_index = None
+        self._partial_phone_index = None
+        self._fuzzy_name_index = None
+        self._sorted_indexes = {}
+        self._letter_buckets.clear()
+        self._order = {contact: order for order, contact in enumerate(self.contacts)}
+        self._next_order = len(self.contacts)
+        for contact in self.contacts:
+            self._add_to_lookup_indexes(contact)
+
+    @instrumented('create')
+    def add_contact(self, contact):
+        '''
+        Append a contact to the phone book and index it
+        '''
+        self.contacts.append(contact)
+        self._index_contact(contact)
+        if self._journal is not None:
+            self._journal_record({"op": "create", "contact": contact.to_dict()})
+
+    @instrumented('delete')
+    def remove_contact(self, contact):
+        '''
+        Remove a contact from the phone book and its indexes
+        '''
+        self.contacts.remove(contact)
+        self._forget_contact(contact)
+        self._journal_record({"op": "delete", "name": self.normalize_name(contact.get_first_name(), contact.get_last_name())})
+
+    def clear_contacts(self):
+        '''
+        Remove every contact from the phone book and reset the indexes
+        '''
+        self.contacts.clear()
+        self._rebuild_indexes()
+        self._journal_record({"op": "clear"})
+
+    @instrumented('update')
+    def update_contact_field(self, contact, field_index, new_value):
+        '''
+        Update one field of a contact and keep the indexes in sync
+        field_index follows the Update Contact menu: 1 first name, 2 last name, 3 phone number, 4 email address, 5 address
+        '''
+        self.update_contact_fields(contact, {field_index: new_value})
+
+    @instrumented('update')
+    def update_contact_fields(self, contact, changes):
+        '''
+        Update several fields of a contact at once, changes maps field indexes (see update_contact_field) to new values
+        The contact is indexed again once all fields are set, so an intermediate name (the new first name with
+        the old last name) is never indexed, and the changes are journaled as one record
+        '''
+        name = self.normalize_name(contact.get_first_name(), contact.get_last_name())
+        history_length = len(contact.get_history())
+        self._unindex_contact(contact)
+        for field_index, new_value in changes.items():
+            if field_index == '1':
+                contact.set_first_name(new_value)
+            elif field_index == '2':
+                contact.set_last_name(new_value)
+            elif field_index == '3':
+                contact.set_phone_number(new_value)
+            elif field_index == '4':
+                contact.set_email_address(new_value)
+            elif field_index == '5':
+                contact.set_address(new_value)
+        self._index_contact(contact)
+        new_changes = contact.get_history()[history_length:]
+        if new_changes:
+            self._journal_record({"op": "update", "name": name, "changes": [change.to_dict() for change in new_changes]})
+
+    def open_journal(self, journal_path, snapshot_path, binary_snapshot_path=None):
+        '''
+        Replay the journal at journal_path on top of the contacts imported from snapshot_path,
+        then record every following create, update and delete operation in it
+        The snapshot is rewritten and the journal emptied when the journal grows too large compared to the snapshot
+        (see compact_ratio and compact_min_size), so that the cost of compacting stays proportional to the changes made
+        If binary_snapshot_path is given, a binary snapshot (see export_contacts_to_snapshot) is rewritten with it
+        journal_path can also be a Journal opened before importing the snapshot, so that its lock is already held
+        Raise JournalLockedError if the journal is open in another process
+        '''
+        journal = journal_path if isinstance(journal_path, Journal) else Journal(journal_path)
+        self.logger.info(f"Open journal {journal.file_path}")
+        self._journal = None
+        # A crash after a compaction replaced the snapshot but before it emptied the journal leaves records
+        # the snapshot already holds, followed by the "compacted" record naming that snapshot: they are skipped
+        snapshot_identity = file_identity(snapshot_path)
+        skipped = 0
+        for position, record in enumerate(journal.records(), 1):
+            if record.get("op") == "compacted" and record.get("snapshot") == snapshot_identity:
+                skipped = position
+        replayed = 0
+        for position, record in enumerate(journal.records(), 1):
+            if position > skipped:
+                self._replay_record(record)
+                replayed += 1
+        journal.count = replayed
+        self._journal = journal
+        self._snapshot_path = snapshot_path
+        self._binary_snapshot_path = binary_snapshot_path
+        self._snapshot_size = os.path.getsize(snapshot_path) if os.path.exists(snapshot_path) else 0
+        if skipped:
+            self.logger.info(f"Skipped {skipped} journal records already saved in {snapshot_path}")
+        if replayed:
+            print(f"{replayed} journaled changes replayed from {journal.file_path}")
+            self.logger.info(f"Replayed {replayed} journal records from {journal.file_path}")
+        if journal.damaged:
+            # Compacting empties the journal, the unreadable part is kept aside for a manual recovery
+            damaged_path = journal.file_path + ".damaged"
+            shutil.copyfile(journal.file_path, damaged_path)
+            print(f"Warning: {journal.file_path} is damaged, the changes after the damaged record were not replayed "
+                  f"and the journal was saved to {damaged_path}")
+            self.logger.warning(f"Damaged journal {journal.file_path} saved to {damaged_path}")
+        if skipped or journal.damaged or self._journal_too_large():
+            self.compact_journal()
+
+    def close_journal(self):
+        '''
+        Stop journaling; the records stay in the journal file and are replayed by the next open_journal
+        '''
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            self.logger.info("Journal closed")
+
+    def compact_journal(self):
+        '''
+        Save all contacts to the snapshot file and empty the journal
+        The snapshot is replaced atomically (see atomic_file.atomic_write) so a crash cannot leave it truncated
+        '''
+        if self._journal is None:
+            return
+        with atomic_write(self._snapshot_path, before_replace=self._journal_compacted) as json_file:
+            self._write_contacts(json_file, is_ndjson_path(self._snapshot_path))
+        if self._binary_snapshot_path:
+            # Written after the JSON file, so it is only newer than it if both hold the same contacts
+            write_snapshot(self._binary_snapshot_path, self.contacts)
+        self._journal.truncate()
+        self._snapshot_size = os.path.getsize(self._snapshot_path)
+        self.logger.info(f"Journal compacted into {self._snapshot_path}")
+
+    def _journal_compacted(self, snapshot_temp_path):
+        '''
+        Record in the journal, before the new snapshot replaces the old one, that the records so far are saved in it
+        so that open_journal does not replay them again if the process dies before the journal is emptied
+        '''
+        self._journal.append({"op": "compacted", "snapshot": file_identity(snapshot_temp_path)}, sync=True)
+
+    def _journal_too_large(self):
+        '''
+        Return True if a journal is open and has grown large enough to be compacted
+        '''
+        return (self._journal is not None
+                and self._journal.size > max(self._snapshot_size * self.compact_ratio, self.compact_min_size))
+
+    @contextmanager
+    def journal_batch(self):
+        '''
+        Context manager grouping many changes: the journal is not compacted inside the with block,
+        only once at its end if it has grown too large, instead of rewriting the whole snapshot repeatedly
+        '''
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._journal_too_large():
+                self.compact_journal()
+
+    def _journal_record(self, record):
+        '''
+        Append a record to the journal if one is open, compacting it when it grows too large
+        '''
+        if self._journal is None:
+            return
+        self._journal.append(record)
+        if not self._batch_depth and self._journal_too_large():
+            self.compact_journal()
+
+    def _replay_record(self, record):
+        '''
+        Apply one journal record to the phone book
+        '''
+        op = record.get("op")
+        if op == "create":
+            self.add_contact(Contact.from_dict(record["contact"], False))
+        elif op == "update":
+            contact = self._name_index.get(record["name"])
+            if contact is not None:
+                self._unindex_contact(contact)
+                # Journals written before multi-field updates hold one change per record
+                for change in record.get("changes") or [record["change"]]:
+                    contact.apply_change(Change.from_dict(change))
+                self._index_contact(contact)
+        elif op == "delete":
+            contact = self._name_index.get(record["name"])
+            if contact is not None:
+                self.remove_contact(contact)
+        elif op == "clear":
+            self.clear_contacts()
 
     def print_all_contacts(self):
         '''
@@ -26,14 +489,13 @@ class PhoneBook:
         print("[Print All Contacts]")
         self.logger.info("Print all contacts")
         
-        if not self.contacts:
+        count = self._contact_count()
+        if not count:
             print("No contacts available.\n")
             return
 
-        headers = ["First Name", "Last Name", "Phone Number", "Email Address", "Address"]
-        rows = [[contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
-                 contact.get_email_address(), contact.get_address()] for contact in self.contacts]
-        print(tabulate(rows, headers=headers, tablefmt="grid"))
+        # Only the contacts of the pages shown are read
+        self.print_contact_list(PagedSequence(count, self._contact_slice), False)
         print()
     
     def print_contact(self, contact):
@@ -43,60 +505,124 @@ class PhoneBook:
         print(tabulate(rows, headers=headers, tablefmt="grid"))
         print()
 
+    def print_contact_history(self, contact):
+        '''
+        Print the history of changes of a contact
+        If older changes were archived, allow the user to page through them from the history archive
+        '''
+        contact.print_history()
+        if not contact.has_archived_history() or self.history_archive is None:
+            return
+        choice = input("Enter o to view the archived older changes, or press Enter to continue: ").strip().lower()
+        if choice != 'o':
+            return
+        changes = self.history_archive.changes(contact)
+        self.logger.info("View archived history of changes")
+        if not changes:
+            print("No archived changes found.")
+            return
+        headers = ["Change Time", "Operation", "Field", "Old Value", "New Value"]
+        to_row = lambda change: [change.get_change_time(), change.get_operation(), change.get_field() or change.get_message(),
+                                 change.get_old_value(), change.get_new_value()]
+        page_through(changes, to_row, headers)
+
     def print_contact_list(self, contacts, show_index=True, show_create_time=False, show_update_time=False):
         '''
         Print a list of contacts in a tabular format
         Optionally show the index of each contact, the create time, or the update time
+        Lists longer than one page are shown page by page
         '''
         headers = ["First Name", "Last Name", "Phone Number", "Email Address", "Address"]
         if show_create_time:
             headers.append("Create Time")
-            rows = [[contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
-                 contact.get_email_address(), contact.get_address(), contact.get_create_time()] for contact in contacts]
-            print(tabulate(rows, headers=headers, tablefmt="grid", showindex = show_index))
-            return
-        
-        if show_update_time:
+            to_row = lambda contact: [contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
+                                      contact.get_email_address(), contact.get_address(), contact.get_create_time()]
+        elif show_update_time:
             headers.append("Update Time")
-            rows = [[contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
-                 contact.get_email_address(), contact.get_address(), contact.get_update_time()] for contact in contacts]
+            to_row = lambda contact: [contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
+                                      contact.get_email_address(), contact.get_address(), contact.get_update_time()]
+        else:
+            to_row = lambda contact: [contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
+                                      contact.get_email_address(), contact.get_address()]
+
+        if len(contacts) > PAGE_SIZE:
+            page_through(contacts, to_row, headers, PAGE_SIZE, show_index)
+        else:
+            rows = [to_row(contact) for contact in contacts]
             print(tabulate(rows, headers=headers, tablefmt="grid", showindex = show_index))
-            return
-        
-        rows = [[contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
-                 contact.get_email_address(), contact.get_address()] for contact in contacts]
-        print(tabulate(rows, headers=headers, tablefmt="grid", showindex = show_index))
     
     def is_valid_email(self, email):
         '''
         Check if the email address is valid using regular expressions
         '''
-        if email == "":
-            return True
-        
-        # Regular expression for validating an email address: (user_name)@(domain_name).(top-leveldomain)  
-        email_regex = re.compile(r'([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+')
-        return re.fullmatch(email_regex, email) is not None
+        return validation.is_valid_email(email)
     
     def is_valid_phone_number(self, phone_number):
         '''
         Check if the phone number is valid using regular expressions
         Phone number should be in the format (###) ###-####
         '''
-        # Regular expression for validating a phone number: (###) ###-####
-        phone_number_regex = re.compile(r'\(\d{3}\) \d{3}-\d{4}')
-        return re.fullmatch(phone_number_regex, phone_number) is not None
+        return validation.is_valid_phone_number(phone_number)
     
     def is_contact_exist(self, first_name, last_name):
         '''
         Check if a contact with the given first name and last name already exists in the phone book
         '''
-        full_name_to_check = f"{first_name.lower()} {last_name.lower()}"
-        for contact in self.contacts:
-            full_name = f"{contact.get_first_name().lower()} {contact.get_last_name().lower()}"
-            if full_name == full_name_to_check:
-                return True
-        return False
+        return self.normalize_name(first_name, last_name) in self._name_index
+
+    @instrumented('search_name')
+    @cached_search('name', SEARCH_KEYS['name'])
+    def find_contacts_by_name(self, query):
+        '''
+        Return the contacts whose full name contains query, ignoring case and whitespace
+        '''
+        name_index, phone_index = self._partial_indexes()
+        matches = name_index.search(self.compact_name(query))
+        self.stats.count_rows(scanned=name_index.last_scanned)
+        return matches
+
+    @instrumented('search_phone')
+    @cached_search('phone', SEARCH_KEYS['phone'])
+    def find_contacts_by_phone(self, query):
+        '''
+        Return the contacts whose phone number digits contain the digits of query
+        Non-digit characters in query are ignored, so "555-01" matches "(555) 012-3456"
+        '''
+        query_number = re.sub(r'\D', '', query)
+        if query_number == "":
+            return []
+        name_index, phone_index = self._partial_indexes()
+        matches = phone_index.search(query_number)
+        self.stats.count_rows(scanned=phone_index.last_scanned)
+        return matches
+
+    @instrumented('search_fuzzy_name')
+    @cached_search('fuzzy_name', SEARCH_KEYS['fuzzy_name'])
+    def find_contacts_by_fuzzy_name(self, query, max_distance=None):
+        '''
+        Return the contacts whose first, last or full name is within max_distance edits of query (ignoring case),
+        closest first, so "Jonhson" finds "Johnson"
+        max_distance defaults to fuzzy_max_distance(query)
+        '''
+        if max_distance is None:
+            max_distance = self.fuzzy_max_distance(query.strip())
+        fuzzy_index = self._fuzzy_index()
+        matches = [contact for contact, distance in fuzzy_index.search(query, max_distance)]
+        self.stats.count_rows(scanned=fuzzy_index.last_scanned)
+        return matches
+
+    @instrumented('search_date')
+    @cached_search('date', SEARCH_KEYS['date'])
+    def find_contacts_by_date(self, start_date, end_date, field='create'):
+        '''
+        Return the contacts created (field='create') or last updated (field='update')
+        between start_date and end_date inclusively, ordered by that time
+        '''
+        index = self._sorted_index('create_time' if field == 'create' else 'update_time')
+        matches = index.range(to_timestamp(datetime.combine(start_date, time.min)), to_timestamp(datetime.combine(end_date, time.max)))
+        # The range is found by binary search, only the matching rows are read
+        self.stats.count_rows(scanned=len(matches))
+        return matches
 
     def input_mandatory_field(self, value):
         '''
@@ -135,7 +661,7 @@ class PhoneBook:
                 # Check for duplicated contacts
                 if not self.is_contact_exist(first_name, last_name):
                     new_contact = Contact(first_name, last_name, phone_number, email_address, address)
-                    self.contacts.append(new_contact)
+                    self.add_contact(new_contact)
                     print(f"Contact added: {first_name} {last_name}, {phone_number}, {email_address}, {address}\n")
                 else:
                     print(f"Failed to add contact. Contact '{first_name} {last_name}' already exists.\n")
@@ -143,55 +669,8 @@ class PhoneBook:
 
             elif choice == '2':
                 csv_file = input("Enter the path to the CSV file: ")
-                self.logger.info(f"Start batch add contacts from {csv_file}")
                 try:
-                    with open(csv_file, newline='') as file:
-                        reader = csv.reader(file)
-                        attempted_additions = 0
-                        successful_additions = 0
-                        for row in reader:
-                            attempted_additions += 1
-                            first_name = row[0].strip() if row else ""
-                            last_name = row[1].strip() if len(row) > 1 else ""
-                            phone_number = row[2].strip() if len(row) > 2 else ""
-                            email_address = row[3] if len(row) > 3 else ""
-                            address = row[4] if len(row) > 4 else ""
-
-                            is_valid = True
-                            error_message = f"[Failed] Contact {attempted_additions} not added: "
-
-                            # Check for duplicated contacts
-                            if self.is_contact_exist(first_name, last_name):
-                                is_valid = False
-                                error_message += f"Contact '{first_name} {last_name}' already exists. "
-                            
-                            # Check for mandatory fields, validate phone number and email
-                            if not first_name:
-                                is_valid = False
-                                error_message += "First name missing. "
-                            if not last_name: 
-                                is_valid = False
-                                error_message += "Last name missing. "
-                            if not phone_number:
-                                is_valid = False
-                                error_message += "Phone number missing. "
-                            if phone_number and not self.is_valid_phone_number(phone_number):
-                                is_valid = False
-                                error_message += "Phone number invalid, should be in format (###) ###-####. "
-                            if email_address and not self.is_valid_email(email_address):
-                                is_valid = False
-                                error_message += "Email address invalid. "                           
-                            
-                            if is_valid:
-                                successful_additions += 1
-                                new_contact = Contact(first_name, last_name, phone_number, email_address, address)
-                                self.contacts.append(new_contact)
-                                print(f"[Succeeded] Contact {attempted_additions} added: {first_name} {last_name}, {phone_number}, {email_address}, {address}")
-                            else:
-                                print(error_message)
-                                self.logger.info("Contact addition failed: " + error_message)
-                        print(f"Batch addition completed: {successful_additions}/{attempted_additions} contacts added successfully.\n")
-                        self.logger.info(f"Batch addition completed: {successful_additions}/{attempted_additions} contacts added successfully")
+                    self.import_contacts_from_csv(csv_file)
                 except FileNotFoundError:
                     print("CSV file not found. Please try again.\n")
                     self.logger.info("Batch addition failed: CSV file not found")
@@ -204,11 +683,49 @@ class PhoneBook:
             else:
                 print("Invalid choice. Please try again.\n")
 
+    @instrumented('batch_add_csv')
+    def import_contacts_from_csv(self, csv_file, workers=None, chunk_size=CHUNK_SIZE, quiet=False):
+        '''
+        Add contacts from a CSV file, each row being: first_name, last_name, phone_number, email_address, address
+        Rows are validated in parallel worker processes (see batch_import.validated_rows) and added in file order,
+        checking for duplicates against existing contacts and earlier rows
+        Print the result of every row unless quiet is True
+        Return (successful_additions, attempted_additions)
+        Raise FileNotFoundError if the file does not exist
+        '''
+        self.logger.info(f"Start batch add contacts from {csv_file}")
+        attempted_additions = 0
+        successful_additions = 0
+        with self.journal_batch():
+            for first_name, last_name, phone_number, email_address, address, errors in validated_rows(csv_file, workers, chunk_size):
+                attempted_additions += 1
+
+                # Check for duplicated contacts
+                if self.is_contact_exist(first_name, last_name):
+                    errors.insert(0, f"Contact '{first_name} {last_name}' already exists. ")
+
+                if not errors:
+                    successful_additions += 1
+                    new_contact = Contact(first_name, last_name, phone_number, email_address, address)
+                    self.add_contact(new_contact)
+                    if not quiet:
+                        print(f"[Succeeded] Contact {attempted_additions} added: {first_name} {last_name}, {phone_number}, {email_address}, {address}")
+                else:
+                    error_message = f"[Failed] Contact {attempted_additions} not added: " + "".join(errors)
+                    if not quiet:
+                        print(error_message)
+                    self.logger.info("Contact addition failed: " + error_message)
+        if not quiet:
+            print(f"Batch addition completed: {successful_additions}/{attempted_additions} contacts added successfully.\n")
+        self.logger.info(f"Batch addition completed: {successful_additions}/{attempted_additions} contacts added successfully")
+        self.stats.count_rows(scanned=attempted_additions, matched=successful_additions)
+        return successful_additions, attempted_additions
+
     def search_contact(self):
         '''
         Search for contacts by full name, phone number, or date created
         Display the search results and allow the user to view the history of changes for a specific contact
-        Support partial match for full name and phone number
+        Support partial match for full name and phone number, and similar spelling for names
         '''
         print("[Search Contact]")
         self.logger.info("Start search for contacts")
@@ -217,10 +734,12 @@ class PhoneBook:
             print("1. Full name")
             print("2. Telephone number")
             print("3. Date created")
+            print("4. Date updated")
+            print("5. Full name (similar spelling)")
             print("Or enter q to quit.")
-            search_type = input("Enter your choice (1/2/3/q): ").strip()
+            search_type = input("Enter your choice (1/2/3/4/5/q): ").strip()
 
-            while search_type not in ['1', '2', '3', 'q']:
+            while search_type not in ['1', '2', '3', '4', '5', 'q']:
                 search_type = input("Invalid choice. Please enter a valid option: ").strip()
             
             if search_type == 'q':
@@ -230,6 +749,7 @@ class PhoneBook:
 
             matches = []
             show_create_time = False
+            show_update_time = False
             if search_type in ['1', '2']:
                 search_query = self.input_mandatory_field(input("Enter the search query (partial match supported): ").strip()) 
                 
@@ -238,25 +758,25 @@ class PhoneBook:
                 elif search_type == '2':
                     self.logger.info(f"Search by phone number: {search_query}")
 
-                for contact in self.contacts:
-                    if search_type == '1':
-                        query_name = ''.join(search_query.lower().split())
-                        full_name = ''.join(f"{contact.get_first_name()} {contact.get_last_name()}".lower().split())
-                        if query_name in full_name:
-                            matches.append(contact)
-                    elif search_type == '2':
-                        query_number = re.sub(r'\D', '', search_query)
-                        phone_number = re.sub(r'\D', '', contact.get_phone_number())
-                        if not query_number == "" and query_number in phone_number:
-                            matches.append(contact)
+                if search_type == '1':
+                    matches = self.find_contacts_by_name(search_query)
+                elif search_type == '2':
+                    matches = self.find_contacts_by_phone(search_query)
             
             elif search_type == '3':
                 matches = self.search_contacts_by_date()
                 show_create_time = True
+            elif search_type == '4':
+                matches = self.search_contacts_by_date('update')
+                show_update_time = True
+            elif search_type == '5':
+                search_query = self.input_mandatory_field(input("Enter the name (typos allowed, closest matches first): ").strip())
+                self.logger.info(f"Search by similar name: {search_query}")
+                matches = self.find_contacts_by_fuzzy_name(search_query)
 
             if matches:
                 print("\nHere are the contacts that meet the requirement:")
-                self.print_contact_list(matches, True, show_create_time)
+                self.print_contact_list(matches, True, show_create_time, show_update_time)
             else:
                 print("No contact meets the requirement.\n")
                 continue
@@ -275,15 +795,15 @@ class PhoneBook:
             contact_to_view = matches[index]
 
             print("\nHistory of changes:")
-            contact_to_view.print_history()
+            self.print_contact_history(contact_to_view)
             print()
             self.logger.info("View history of changes")
 
-    def search_contacts_by_date(self):
+    def search_contacts_by_date(self, field='create'):
         '''
-        Search for contacts by the date created
+        Search for contacts by the date created (field='create') or the date last updated (field='update')
         Allow the user to enter a single date or a date range
-        Return a list of contacts that were created within the specified date range
+        Return a list of contacts that were created or updated within the specified date range
         '''
         print("\nSearch contacts by date (inclusively):")
         print("Enter a single date (yyyy-mm-dd) or a date range (yyyy-mm-dd yyyy-mm-dd)")
@@ -317,13 +837,11 @@ class PhoneBook:
             else:
                 dates = input("Invalid date format. Please try again: ").strip().split()
 
-        self.logger.info(f"Search by creation date: {start_date} to {end_date}")
-        for contact in self.contacts:
-            create_time = contact.get_create_time().date()
-            if start_date <= create_time <= end_date:
-                matches.append(contact)
-        
-        return matches
+        if field == 'create':
+            self.logger.info(f"Search by creation date: {start_date} to {end_date}")
+        else:
+            self.logger.info(f"Search by update date: {start_date} to {end_date}")
+        return self.find_contacts_by_date(start_date, end_date, field)
 
     def update_contact(self):
         '''
@@ -342,12 +860,12 @@ class PhoneBook:
                 self.logger.info("Quit update contact")
                 break
 
-            matches = []
-            for contact in self.contacts:
-                query_name = ''.join(search_query.lower().split())
-                full_name = ''.join(f"{contact.get_first_name()} {contact.get_last_name()}".lower().split())
-                if query_name in full_name:
-                    matches.append(contact)
+            matches = self.find_contacts_by_name(search_query)
+            if not matches:
+                # Suggest contacts with a similar name in case of a typo
+                matches = self.find_contacts_by_fuzzy_name(search_query)
+                if matches:
+                    print("No contact matches the query. Did you mean:")
 
             if not matches:
                 print("No contact matches the query. Please try again.\n")
@@ -410,7 +928,6 @@ class PhoneBook:
                             print(f"Failed to update contact. Contact '{new_value} {contact_to_update.get_last_name()}' already exists.\n")
                             self.logger.info(f"Failed to update contact: Contact '{new_value} {contact_to_update.get_last_name()}' already exists")
                             continue
-                    contact_to_update.set_first_name(new_value)
                 elif field_index == '2':
                     # Check for duplicated contacts
                     old_value = contact_to_update.get_last_name()
@@ -419,13 +936,7 @@ class PhoneBook:
                             print(f"Failed to update contact. Contact '{contact_to_update.get_first_name()} {new_value}' already exists.\n")
                             self.logger.info(f"Failed to update contact: Contact '{contact_to_update.get_first_name()} {new_value}' already exists")
                             continue
-                    contact_to_update.set_last_name(new_value)
-                elif field_index == '3':
-                    contact_to_update.set_phone_number(new_value)
-                elif field_index == '4':
-                    contact_to_update.set_email_address(new_value)
-                elif field_index == '5':
-                    contact_to_update.set_address(new_value)
+                self.update_contact_field(contact_to_update, field_index, new_value)
 
                 print("The contact is now: ")
                 self.print_contact(contact_to_update)
@@ -458,12 +969,12 @@ class PhoneBook:
                 self.logger.info(f"Try to delete contact: {delete_query}")
 
                 # Search for the contact to delete by name
-                matches = []
-                for contact in self.contacts:
-                    query_name = ''.join(delete_query.lower().split())
-                    full_name = ''.join(f"{contact.get_first_name()} {contact.get_last_name()}".lower().split())
-                    if query_name in full_name:
-                        matches.append(contact)
+                matches = self.find_contacts_by_name(delete_query)
+                if not matches:
+                    # Suggest contacts with a similar name in case of a typo
+                    matches = self.find_contacts_by_fuzzy_name(delete_query)
+                    if matches:
+                        print(f"Contact '{delete_query}' not found. Did you mean:")
 
                 if not matches:
                     print(f"Contact '{delete_query}' not found.\n")
@@ -486,39 +997,14 @@ class PhoneBook:
                     contact_to_delete = matches[index]
                     
                     delete_name = f"{contact_to_delete.get_first_name()} {contact_to_delete.get_last_name()}"
-                    self.contacts.remove(contact_to_delete)
+                    self.remove_contact(contact_to_delete)
                     print(f"Contact '{delete_name}' deleted\n")
                     self.logger.info(f"Contact deleted: {delete_name}")
 
             elif choice == '2':
                 csv_file = input("Enter the path to the CSV file: ").strip()
-                self.logger.info(f"Start batch delete contacts from {csv_file}")
                 try:
-                    with open(csv_file, newline='') as file:
-                        reader = csv.reader(file)
-                        attempted_deletions = 0
-                        successful_deletions = 0
-                        for row in reader:
-                            if row:
-                                full_name = row[0].strip()
-                                if full_name:
-                                    attempted_deletions += 1
-                                    found = False
-                                    for contact in self.contacts:
-                                        # Name should be exactly matches, case-insensitive
-                                        contact_full_name = f"{contact.get_first_name()} {contact.get_last_name()}"
-                                        if contact_full_name.lower() == full_name.lower():
-                                            self.contacts.remove(contact)
-                                            print(f"[Succeeded] Contact '{contact_full_name}' deleted")
-                                            self.logger.info(f"Contact deleted: {contact_full_name}")
-                                            successful_deletions += 1
-                                            found = True
-                                            break
-                                    if not found:
-                                        print(f"[Failed] Contact '{full_name}' not found")
-                                        self.logger.info(f"Contact not found: {full_name}")
-                        print(f"Batch delete completed: {successful_deletions}/{attempted_deletions} contacts deleted successfully.\n")
-                        self.logger.info(f"Batch delete completed: {successful_deletions}/{attempted_deletions} contacts deleted successfully")
+                    self.delete_contacts_from_csv(csv_file)
                 except FileNotFoundError:
                     print("CSV file not found. Please try again.\n")
                     self.logger.info("Batch delete failed: CSV file not found")
@@ -526,6 +1012,64 @@ class PhoneBook:
             elif choice == '3':
                 self.delete_all_contacts()
 
+    @instrumented('batch_delete_csv')
+    def delete_contacts_from_csv(self, csv_file, quiet=False):
+        '''
+        Delete the contacts listed in a CSV file, each row being the full name of a contact (exact match, case-insensitive)
+        Print the result of every row unless quiet is True
+        Return (successful_deletions, attempted_deletions)
+        Raise FileNotFoundError if the file does not exist
+        '''
+        self.logger.info(f"Start batch delete contacts from {csv_file}")
+        with open(csv_file, newline='') as file:
+            reader = csv.reader(file)
+            full_names = [row[0].strip() for row in reader if row and row[0].strip()]
+
+        attempted_deletions = 0
+        successful_deletions = 0
+        for full_name, contact in self.delete_contacts_by_names(full_names):
+            attempted_deletions += 1
+            if contact is not None:
+                contact_full_name = f"{contact.get_first_name()} {contact.get_last_name()}"
+                if not quiet:
+                    print(f"[Succeeded] Contact '{contact_full_name}' deleted")
+                self.logger.info(f"Contact deleted: {contact_full_name}")
+                successful_deletions += 1
+            else:
+                if not quiet:
+                    print(f"[Failed] Contact '{full_name}' not found")
+                self.logger.info(f"Contact not found: {full_name}")
+        if not quiet:
+            print(f"Batch delete completed: {successful_deletions}/{attempted_deletions} contacts deleted successfully.\n")
+        self.logger.info(f"Batch delete completed: {successful_deletions}/{attempted_deletions} contacts deleted successfully")
+        self.stats.count_rows(scanned=attempted_deletions, matched=successful_deletions)
+        return successful_deletions, attempted_deletions
+
+    def delete_contacts_by_names(self, full_names):
+        '''
+        Delete the contacts whose full name exactly matches one of the given names (case-insensitive)
+        Targets are resolved through the name index and the contact list is rebuilt once
+        Return a list of (full_name, deleted contact or None) in the order the names were given
+        '''
+        results = []
+        to_delete = set()
+        for full_name in full_names:
+            contact = self._name_index.get(full_name.lower())
+            if contact is not None and id(contact) not in to_delete:
+                to_delete.add(id(contact))
+                results.append((full_name, contact))
+            else:
+                results.append((full_name, None))
+
+        if to_delete:
+            self.contacts = [contact for contact in self.contacts if id(contact) not in to_delete]
+            with self.journal_batch():
+                for full_name, contact in results:
+                    if contact is not None:
+                        self._forget_contact(contact)
+                        self._journal_record({"op": "delete", "name": full_name.lower()})
+        return results
+
     def delete_all_contacts(self):
         '''
         Delete all contacts in the phone book after confirming with the user
@@ -537,7 +1081,7 @@ class PhoneBook:
             choice = input("Invalid choice. Please enter yes or no: ").strip().lower()
         
         if choice == 'yes':
-            self.contacts.clear()
+            self.clear_contacts()
             print("All contacts deleted.")
             self.logger.info("All contacts deleted\n")
         else:
@@ -589,25 +1133,19 @@ class PhoneBook:
             show_create_time = (sort_choice == '4')
             show_update_time = (sort_choice == '5')
 
-            if sort_choice == '1':
-                self.contacts.sort(key=lambda contact: contact.get_first_name().lower(), reverse=reverse)
-                self.logger.info(f"Sorted contacts by first name {order}")
-            elif sort_choice == '2':
-                self.contacts.sort(key=lambda contact: contact.get_last_name().lower(), reverse=reverse)
-                self.logger.info(f"Sorted contacts by last name {order}")
-            elif sort_choice == '3':
-                self.contacts.sort(key=lambda contact: int(re.sub(r'\D', '', contact.get_phone_number())), reverse=reverse)
-                self.logger.info(f"Sorted contacts by phone number {order}")
-            elif sort_choice == '4':
-                self.contacts.sort(key=lambda contact: contact.get_create_time(), reverse=reverse)
-                self.logger.info(f"Sorted contacts by create time {order}")
-            elif sort_choice == '5':
-                self.contacts.sort(key=lambda contact: contact.get_update_time(), reverse=reverse)
-                self.logger.info(f"Sorted contacts by update time {order}")
+            sort_key, sort_name = {
+                '1': ('first_name', 'first name'),
+                '2': ('last_name', 'last name'),
+                '3': ('phone_number', 'phone number'),
+                '4': ('create_time', 'create time'),
+                '5': ('update_time', 'update time'),
+            }[sort_choice]
+            first_contacts = self.sorted_contacts(sort_key, reverse, 0, 5)
+            self.logger.info(f"Sorted contacts by {sort_name} {order}")
 
             # Display the first few contacts after sorting
             print("\nContacts sorted successfully. Here are the first few contacts: ")
-            self.print_contact_list(self.contacts[:5], False, show_create_time, show_update_time)
+            self.print_contact_list(first_contacts, False, show_create_time, show_update_time)
 
             # Ask the user if they want to see the whole list
             show_more = input("Do you want to see the whole list? Enter 1 to show more or q to quit: ").strip()
@@ -615,10 +1153,56 @@ class PhoneBook:
                 show_more = input("Invalid choice. Please enter 1 or q: ").strip()
             
             if show_more == '1':
-                self.print_contact_list(self.contacts[5:], False, show_create_time, show_update_time)
+                self.print_contact_list(self.sorted_contacts(sort_key, reverse, 5), False, show_create_time, show_update_time)
             
             print()
 
+    @instrumented('sort')
+    def sorted_contacts(self, sort_key, reverse=False, start=0, stop=None):
+        '''
+        Return the contacts from position start to stop in the order of sort_key (a key of SORT_KEYS)
+        The sorted view of sort_key is kept up to date on every change, so only the returned rows are read
+        Before a view exists, the first rows are selected with a heap instead of sorting every contact
+        '''
+        if sort_key not in self._sorted_indexes:
+            self.stats.count_rows(scanned=len(self.contacts))
+            if start == 0 and stop is not None:
+                # Ties are broken on the insertion order like in the sorted view (reversed with it), so the
+                # first rows selected here are followed by the right ones when the rest is read from the view
+                select = heapq.nlargest if reverse else heapq.nsmallest
+                key = SORT_KEYS[sort_key]
+                return select(stop, self.contacts, key=lambda contact: (key(contact), self._order[contact]))
+        view = self._sorted_index(sort_key)
+
+        if not reverse:
+            contacts = view[start:stop]
+        else:
+            count = len(view)
+            stop = count if stop is None else min(stop, count)
+            contacts = view[max(count - stop, 0):max(count - start, 0)][::-1]
+        self.stats.count_rows(scanned=len(contacts))
+        return contacts
+
+    @instrumented('group_counts')
+    def group_counts(self):
+        '''
+        Return a dictionary mapping each group letter (see group_letter) to its number of contacts, sorted by letter
+        '''
+        return {letter: len(self._letter_buckets[letter]) for letter in sorted(self._letter_buckets)}
+
+    @instrumented('group')
+    def contacts_in_group(self, letter):
+        '''
+        Return the contacts of one group, in insertion order
+        '''
+        return sorted(self._letter_buckets.get(letter, ()), key=self._order.__getitem__)
+
+    def grouped_contacts(self):
+        '''
+        Return a dictionary mapping the first letter of the last name to the list of contacts, sorted by letter
+        '''
+        return {letter: self.contacts_in_group(letter) for letter in self.group_counts()}
+
     def group_contacts(self):
         '''
         Group the contacts by the first letter of the last name
@@ -639,53 +1223,223 @@ class PhoneBook:
             self.logger.info("Quit group contacts")
             return
 
-        # Group contacts by the first letter of last name
-        grouped_contacts = defaultdict(list)
-        for contact in self.contacts:
-            first_letter = contact.get_last_name()[0].upper()
-            grouped_contacts[first_letter].append(contact)
+        # Groups are kept up to date on every change, only their sizes are read here
+        group_counts = self.group_counts()
         self.logger.info("Grouped contacts by first letter of last name")
+        if not group_counts:
+            print("No contacts available.\n")
+            self.logger.info("Quit group contacts")
+            return
 
-        # Sort the dictionary by keys alphabetically (first letters)
-        sorted_grouped_contacts = dict(sorted(grouped_contacts.items()))
-
-        print("\nContacts grouped successfully. Displaying groups:")
-        # Print each group of contacts
-        for letter, contacts in sorted_grouped_contacts.items():
-            print(f"{letter}")
-            headers = ["First Name", "Last Name", "Phone Number", "Email Address", "Address"]
-            rows = [[contact.get_first_name(), contact.get_last_name(), contact.get_phone_number(), 
-                        contact.get_email_address(), contact.get_address()] for contact in contacts]
-            print(tabulate(rows, headers=headers, tablefmt="grid"))
+        print("\nContacts grouped successfully. Number of contacts in each group:")
+        print("  ".join(f"{letter}: {count}" for letter, count in group_counts.items()))
+        while True:
+            letter = input("Enter a letter to view its group, * to view all groups, or q to quit: ").strip()
+            if letter == 'q':
+                break
+            if letter == '*':
+                # Print each group of contacts
+                for group in group_counts:
+                    print(f"{group}")
+                    self.print_contact_list(self.contacts_in_group(group), False)
+            elif letter.upper() in group_counts:
+                print(f"{letter.upper()}")
+                self.print_contact_list(self.contacts_in_group(letter.upper()), False)
+            else:
+                print("No contact in this group. Please try again.")
         
         print()
         self.logger.info("Quit group contacts")
 
-    def export_contacts_to_json(self, file_path):
+    def view_statistics(self):
+        '''
+        Print the call counts, latencies and rows scanned/matched of every operation of this session
+        Allow the user to turn memory peak measurement on or off, or to reset the statistics
+        '''
+        print("[View Statistics]")
+        self.logger.info("View statistics")
+        if self.stats.operations:
+            print(self.stats.report())
+        else:
+            print("No operations measured yet.")
+        print(self.search_cache.report())
+        print(f"Memory measurement is {'on' if self.stats.trace_memory else 'off'}.")
+
+        choice = input("Enter m to turn memory measurement on/off, r to reset the statistics, or q to quit: ").strip().lower()
+        while choice not in ['m', 'r', 'q']:
+            choice = input("Invalid choice. Please enter m, r or q: ").strip().lower()
+        if choice == 'm':
+            self.stats.set_memory_tracing(not self.stats.trace_memory)
+            print(f"Memory measurement turned {'on' if self.stats.trace_memory else 'off'}.")
+            self.logger.info(f"Memory measurement turned {'on' if self.stats.trace_memory else 'off'}")
+        elif choice == 'r':
+            self.stats.reset()
+            self.search_cache.reset()
+            print("Statistics reset.")
+            self.logger.info("Statistics reset")
+        print()
+
+    @instrumented('export_json')
+    def export_contacts_to_json(self, file_path, compact=False):
         '''
         Export the contacts to a JSON file
+        A path ending in .ndjson or .jsonl is written with one contact per line
+        If compact is True, the JSON array is written without indentation
+        The file is replaced atomically, so it is never left half-written
         '''
         self.logger.info(f"Export contacts to {file_path}")
-        contacts_data = [contact.to_dict() for contact in self.contacts]
-        with open(file_path, 'w') as json_file:
-            json.dump(contacts_data, json_file, indent=4)
+        with atomic_write(file_path) as json_file:
+            self._write_contacts(json_file, is_ndjson_path(file_path), compact)
+        count = self._contact_count()
+        self.stats.count_rows(scanned=count, matched=count)
         print(f"Contacts successfully exported to {file_path}")
         self.logger.info(f"Contacts exported to {file_path}")
 
-    def import_contacts_from_json(self, file_path):
+    def _write_contacts(self, json_file, ndjson=False, compact=False):
+        '''
+        Write all contacts to an open file as a JSON array (indented unless compact is True),
+        or as one contact per line if ndjson is True
+        Contacts are converted and written one at a time, so the file is never built in memory
+        '''
+        if ndjson:
+            for contact in self.contacts:
+                json_file.write(json.dumps(contact.to_dict()) + "\n")
+        else:
+            write_json_array(json_file, (contact.to_dict() for contact in self.contacts), None if compact else 4)
+
+    @instrumented('archive_history')
+    def archive_histories(self, keep_last=None, keep_days=None):
+        '''
+        Move the old changes of every contact to self.history_archive, so that contacts edited all the time
+        do not slow down loading and saving the phone book
+        The creation of each contact is kept with its last keep_last changes and/or the changes of the last keep_days days
+        The archive is written before the phone book is saved, so a crash can only archive a change twice, never lose it
+        Return (number of contacts trimmed, number of changes archived)
+        '''
+        if self.history_archive is None:
+            raise ValueError("No history archive is set")
+        keep_since = None if keep_days is None else to_timestamp(datetime.now() - timedelta(days=keep_days))
+        entries = []
+        trimmed = []
+        for contact in self._paged_contacts():
+            changes = contact.archivable_changes(keep_last, keep_since)
+            if changes:
+                entries.append((contact_key(contact), changes))
+                trimmed.append((contact, len(changes)))
+        self.history_archive.append(entries)
+        for contact, count in trimmed:
+            contact.remove_archived_changes(count)
+            self._history_replaced(contact)
+        archived = sum(count for contact, count in trimmed)
+        self.stats.count_rows(scanned=self._contact_count(), matched=len(trimmed))
+        self.logger.info(f"Archived {archived} changes of {len(trimmed)} contacts to {self.history_archive.file_path}")
+        # The journal does not record archiving, save the trimmed histories in the snapshot right away
+        self.compact_journal()
+        return len(trimmed), archived
+
+    def _replace_contacts(self, contacts):
+        '''
+        Replace all contacts with the Contact objects yielded by the iterable contacts, used by import_contacts_from_json
+        The contacts are read before any of them is stored, so a file that fails to parse leaves the phone book unchanged
+        '''
+        self.contacts = list(contacts)
+        self._rebuild_indexes()
+
+    def _contact_count(self):
+        '''
+        Return the number of contacts, for subclasses that do not keep them in memory
+        '''
+        return len(self.contacts)
+
+    def _paged_contacts(self):
+        '''
+        Yield all contacts in insertion order, for subclasses that do not keep them in memory
+        '''
+        return iter(self.contacts)
+
+    def _contact_slice(self, start, stop):
+        '''
+        Return the contacts from position start to stop in insertion order, for subclasses that do not keep them in memory
+        '''
+        return self.contacts[start:stop]
+
+    def _history_replaced(self, contact):
+        '''
+        Called when changes were removed from the history of a contact, for subclasses storing histories elsewhere
+        '''
+        pass
+
+    @instrumented('export_snapshot')
+    def export_contacts_to_snapshot(self, file_path):
+        '''
+        Save the contacts to a binary snapshot file, which import_contacts_from_snapshot opens much faster than JSON
+        '''
+        write_snapshot(file_path, self.contacts)
+        count = self._contact_count()
+        self.stats.count_rows(scanned=count, matched=count)
+        self.logger.info(f"Contacts saved to snapshot {file_path}")
+
+    @instrumented('import_snapshot')
+    def import_contacts_from_snapshot(self, file_path):
+        '''
+        Import contacts from a binary snapshot file written by export_contacts_to_snapshot
+        The file is memory-mapped and the history of each contact is only decoded when it is first accessed
+        Return True if the contacts were imported, False if the file is missing or not a valid snapshot
+        '''
+        self.logger.info(f"Import contacts from snapshot {file_path}")
+        try:
+            contacts = read_snapshot(file_path)
+        except FileNotFoundError:
+            print(f"File {file_path} not found.")
+            self.logger.info(f"File {file_path} not found.")
+            return False
+        except ValueError as error:
+            # SnapshotError, or a damaged string heap
+            print(f"Error reading snapshot {file_path}: {error}")
+            self.logger.info(f"Error reading snapshot {file_path}: {error}")
+            return False
+        self.contacts = contacts
+        self.stats.count_rows(scanned=len(contacts), matched=len(contacts))
+        self._rebuild_indexes()
+        # The journal only holds changes on top of the previous contacts, replace them with a snapshot
+        self.compact_journal()
+        print(f"Contacts successfully imported from {file_path}")
+        self.logger.info(f"Contacts imported from snapshot {file_path}")
+        return True
+
+    @instrumented('import_json')
+    def import_contacts_from_json(self, file_path, progress_every=100000, log_contacts=False):
         '''
         Import contacts from a JSON file
+        The file is parsed one contact at a time, so memory does not grow with the size of the document
+        A path ending in .ndjson or .jsonl is read as one contact per line
+        Print progress every progress_every contacts (0 to disable)
+        Each imported contact is only logged if log_contacts is True
+        Return True if the contacts were imported, False if the file is missing or not valid JSON
         '''
         self.logger.info(f"Import contacts from {file_path}")
+
+        def read_contacts(contacts_data):
+            for count, contact in enumerate(contacts_data, 1):
+                yield Contact.from_dict(contact, log_contacts)
+                if progress_every and count % progress_every == 0:
+                    print(f"{count} contacts imported ...")
+
         try:
             with open(file_path, 'r') as json_file:
-                contacts_data = json.load(json_file)
-                self.contacts = [Contact.from_dict(contact) for contact in contacts_data]
+                contacts_data = iter_ndjson(json_file) if is_ndjson_path(file_path) else iter_json_array(json_file)
+                self._replace_contacts(read_contacts(contacts_data))
+            count = self._contact_count()
+            self.stats.count_rows(scanned=count, matched=count)
+            # The journal only holds changes on top of the previous contacts, replace them with a snapshot
+            self.compact_journal()
             print(f"Contacts successfully imported from {file_path}")
             self.logger.info(f"Contacts imported from {file_path}")
+            return True
         except FileNotFoundError:
             print(f"File {file_path} not found.")
             self.logger.info(f"File {file_path} not found.")
         except json.JSONDecodeError:
             print(f"Error decoding JSON from file {file_path}.")
-            self.logger.info(f"Error decoding JSON from file {file_path}.")
\ No newline at end of file
+            self.logger.info(f"Error decoding JSON from file {file_path}.")
+        return False
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+import threading
+
+class ReadWriteLock:
+    '''
+    Class to let many threads read shared data at once while a thread changing it has it to itself
+    Waiting writers go before new readers, so a steady flow of reads cannot starve them, and the readers
+    that waited for a writer go before the next writer, so a steady flow of writes cannot starve reads either
+    The lock is reentrant: the thread holding the write lock can take the write or read lock again,
+    and a thread holding the read lock can take the read lock again. Taking the write lock while holding
+    the read lock raises RuntimeError, as two readers doing it would wait for each other forever
+    '''
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0 # number of threads holding the read lock
+        self._waiting_writers = 0
+        self._writer = None # ident of the thread holding the write lock
+        self._writes = 0 # number of times the write lock was released, readers waiting since an earlier count go first
+        self._write_depth = 0 # number of times the writer took the lock (read locks it takes included)
+        self._local = threading.local() # per thread: read_depth, the number of times it took the read lock
+
+    def acquire_read(self):
+        if self._writer == threading.get_ident():
+            self._write_depth += 1
+            return
+        depth = getattr(self._local, 'read_depth', 0)
+        if depth == 0:
+            with self._condition:
+                writes = self._writes
+                while self._writer is not None or (self._waiting_writers and writes == self._writes):
+                    self._condition.wait()
+                self._readers += 1
+        self._local.read_depth = depth + 1
+
+    def release_read(self):
+        if self._writer == threading.get_ident():
+            self.release_write()
+            return
+        self._local.read_depth -= 1
+        if self._local.read_depth == 0:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        thread = threading.get_ident()
+        if self._writer == thread:
+            self._write_depth += 1
+            return
+        if getattr(self._local, 'read_depth', 0):
+            raise RuntimeError("The write lock cannot be taken while holding the read lock")
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = thread
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            with self._condition:
+                self._writer = None
+                self._writes += 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        '''
+        Hold the read lock inside the with block
+        '''
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        '''
+        Hold the write lock inside the with block
+        '''
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import functools
+import threading
+
+class SearchCache:
+    '''
+    Class to keep the results of the most recently used searches, keyed by (search type, normalized query)
+    Results are tagged with the generation of the phone book they were computed at (see PhoneBook._contacts_changed),
+    the whole cache is dropped as soon as a lookup is made at a newer generation
+    '''
+    def __init__(self, max_size=256):
+        '''
+        Initialize an empty cache of at most max_size results, 0 disables caching
+        '''
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict() # key -> tuple of contacts, least recently used first
+        self._generation = 0 # generation of the phone book the cached results were computed at
+        self._lock = threading.Lock() # searches of a ThreadSafePhoneBook share the cache
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key, generation):
+        '''
+        Return the cached result of key at generation, or None if there is none
+        '''
+        with self._lock:
+            if generation != self._generation:
+                self._results.clear()
+                self._generation = generation
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, generation, result):
+        '''
+        Cache the result of key computed at generation, evicting the least recently used result if the cache is full
+        '''
+        with self._lock:
+            if generation != self._generation or self.max_size <= 0:
+                return
+            self._results[key] = tuple(result)
+            self._results.move_to_end(key)
+            if len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def reset(self):
+        '''
+        Reset the hit and miss counters
+        '''
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = f"{self.hits / lookups:.0%}" if lookups else "-"
+        return f"Search cache: {self.hits} hits, {self.misses} misses (hit rate {hit_rate}), {len(self)}/{self.max_size} results cached"
+
+    def to_dict(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self), "max_size": self.max_size}
+
+def cached_search(search_type, normalize):
+    '''
+    Decorator caching the results of a PhoneBook search method in self.search_cache
+    normalize is called with the arguments of the method and returns the normalized query, so that
+    queries giving the same results share one entry; a cached result is returned as a new list
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (search_type, normalize(self, *args, **kwargs))
+            generation = self._generation
+            result = self.search_cache.get(key, generation)
+            if result is None:
+                result = method(self, *args, **kwargs)
+                self.search_cache.put(key, generation, result)
+            return list(result)
+        return wrapper
+    return decorator
@@ -0,0 +1,275 @@
+from app import close_phone_book, contact_summary, init_logging, open_phone_book
+from contact import Contact
+from journal import JournalLockedError
+from phone_book import SORT_KEYS
+from datetime import datetime
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import signal
+import sys
+import validation
+
+# Protocol: every request and every response is one JSON object on one line
+#
+#   {"id": 1, "op": "search", "type": "name", "query": "smith"}        type: name, phone, fuzzy, created, updated
+#   {"id": 2, "op": "search", "type": "created", "query": "2024-09-19", "end": "2024-09-30"}
+#   {"id": 3, "op": "create", "contact": {"first_name": ..., "last_name": ..., "phone_number": ...,
+#                                         "email_address": ..., "address": ...}}
+#   {"id": 4, "op": "update", "name": "John Smith", "fields": {"phone_number": ..., "address": ...}}
+#   {"id": 5, "op": "delete", "names": ["John Smith", "Jane Doe"]}
+#   {"id": 6, "op": "sort", "key": "last_name", "reverse": false, "start": 0, "stop": 10}
+#   {"id": 7, "op": "group"} returns the size of every group, {"id": 8, "op": "group", "letter": "S"} its contacts
+#
+#   {"id": 1, "status": "ok", "result": {...}} or {"id": 1, "status": "error", "error": "..."}
+#
+# id is optional and returned unchanged, so a client can pipeline requests on one connection
+READ_OPERATIONS = {'search', 'sort', 'group'}
+WRITE_OPERATIONS = {'create', 'update', 'delete'}
+
+# Update Contact menu index of each contact field, see PhoneBook.update_contact_field
+FIELD_INDEXES = {'first_name': '1', 'last_name': '2', 'phone_number': '3', 'email_address': '4', 'address': '5'}
+MANDATORY_FIELDS = ('first_name', 'last_name', 'phone_number')
+
+MAX_LINE_LENGTH = 1024 * 1024 # longest request line accepted, in bytes
+
+class RequestError(ValueError):
+    '''
+    Raised when a request is invalid, its message is sent back to the client
+    '''
+
+class PhoneBookService:
+    '''
+    Class to serve one phone book to many clients over TCP or a Unix socket (see the protocol above)
+    Every request runs to completion on the event loop thread without awaiting anything, so requests from
+    all connections are interleaved but never overlap: a read never sees a write half applied, and writes
+    are applied one at a time in arrival order, validation and duplicate checks included, without a lock
+    List results are cut at max_results contacts, with the full count returned next to them
+    '''
+    logger = logging.getLogger("phoneBookLogger")
+
+    def __init__(self, phone_book, max_results=100):
+        self.phone_book = phone_book
+        self.max_results = max_results
+        self.connections = 0
+
+    async def handle_connection(self, reader, writer):
+        '''
+        Answer the requests of one client in order until it disconnects
+        '''
+        self.connections += 1
+        peer = writer.get_extra_info('peername') or 'unix socket'
+        self.logger.info(f"Service client connected: {peer}")
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(self.encode({"status": "error", "error": f"Request longer than {MAX_LINE_LENGTH} bytes"}))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.encode(await self.handle_line(line)))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self.logger.info(f"Service client disconnected: {peer}")
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    def encode(self, response):
+        return (json.dumps(response) + "\n").encode('utf-8')
+
+    async def handle_line(self, line):
+        '''
+        Decode one request line, run it and return the response dictionary
+        '''
+        try:
+            request = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return {"status": "error", "error": "Request is not valid JSON"}
+        if not isinstance(request, dict):
+            return {"status": "error", "error": "Request must be a JSON object"}
+        response = {"id": request.get("id")}
+        operation = request.get("op")
+        try:
+            # Synchronous on purpose, see the class docstring: an await in a write would need a lock around it
+            if operation in READ_OPERATIONS or operation in WRITE_OPERATIONS:
+                result = self.run(operation, request)
+            else:
+                raise RequestError(f"Unknown operation: {operation}")
+            response.update({"status": "ok", "result": result})
+        except KeyError as error:
+            response.update({"status": "error", "error": f"Missing field: {error.args[0]}"})
+        except (TypeError, ValueError) as error:
+            response.update({"status": "error", "error": str(error)})
+        except Exception:
+            self.logger.exception(f"Service request failed: {operation}")
+            response.update({"status": "error", "error": "Internal error"})
+        return response
+
+    def run(self, operation, request):
+        # The Contact setters print every change for the menu, the clients get the result instead
+        with contextlib.redirect_stdout(io.StringIO()):
+            return getattr(self, f"do_{operation}")(request)
+
+    def contact_list(self, contacts):
+        return {"count": len(contacts), "contacts": [contact_summary(contact) for contact in contacts[:self.max_results]]}
+
+    def do_search(self, request):
+        search_type = request["type"]
+        query = str(request["query"])
+        if search_type == 'name':
+            matches = self.phone_book.find_contacts_by_name(query)
+        elif search_type == 'phone':
+            matches = self.phone_book.find_contacts_by_phone(query)
+        elif search_type == 'fuzzy':
+            matches = self.phone_book.find_contacts_by_fuzzy_name(query)
+        elif search_type in ('created', 'updated'):
+            start_date = datetime.strptime(query, '%Y-%m-%d').date()
+            end_date = datetime.strptime(str(request.get("end", query)), '%Y-%m-%d').date()
+            matches = self.phone_book.find_contacts_by_date(start_date, end_date, 'create' if search_type == 'created' else 'update')
+        else:
+            raise RequestError(f"Unknown search type: {search_type}")
+        return self.contact_list(matches)
+
+    def validate_fields(self, fields):
+        '''
+        Check the contact fields of a create or update request, raise RequestError on the first invalid one
+        '''
+        if not isinstance(fields, dict):
+            raise RequestError("Contact fields must be a JSON object")
+        for field, value in fields.items():
+            if field not in FIELD_INDEXES:
+                raise RequestError(f"Unknown field: {field}")
+            if not isinstance(value, str):
+                raise RequestError(f"{field} must be a string")
+            if field in MANDATORY_FIELDS and not value.strip():
+                raise RequestError(f"{field} is mandatory")
+        if 'phone_number' in fields and not validation.is_valid_phone_number(fields['phone_number'].strip()):
+            raise RequestError("Phone number must be in the format (###) ###-####")
+        if 'email_address' in fields and not validation.is_valid_email(fields['email_address'].strip()):
+            raise RequestError("Invalid email address")
+        return {field: value.strip() for field, value in fields.items()}
+
+    def find_contact(self, name):
+        '''
+        Return the contact whose full name exactly matches name (case-insensitive), raise RequestError if there is none
+        '''
+        key = ' '.join(name.lower().split())
+        matches = [contact for contact in self.phone_book.find_contacts_by_name(name)
+                   if self.phone_book.normalize_name(contact.get_first_name(), contact.get_last_name()) == key]
+        if not matches:
+            raise RequestError(f"Contact '{name}' not found")
+        return matches[0]
+
+    def do_create(self, request):
+        fields = self.validate_fields(request["contact"])
+        for field in MANDATORY_FIELDS:
+            if field not in fields:
+                raise KeyError(field)
+        if self.phone_book.is_contact_exist(fields['first_name'], fields['last_name']):
+            raise RequestError(f"Contact '{fields['first_name']} {fields['last_name']}' already exists")
+        contact = Contact(fields['first_name'], fields['last_name'], fields['phone_number'],
+                          fields.get('email_address', ''), fields.get('address', ''))
+        self.phone_book.add_contact(contact)
+        return contact_summary(contact)
+
+    def do_update(self, request):
+        '''
+        Apply all fields of the request to one contact at once, or none of them if any is invalid
+        '''
+        contact = self.find_contact(str(request["name"]))
+        fields = self.validate_fields(request["fields"])
+        first_name = fields.get('first_name', contact.get_first_name())
+        last_name = fields.get('last_name', contact.get_last_name())
+        if (self.phone_book.normalize_name(first_name, last_name) != self.phone_book.normalize_name(contact.get_first_name(), contact.get_last_name())
+                and self.phone_book.is_contact_exist(first_name, last_name)):
+            raise RequestError(f"Contact '{first_name} {last_name}' already exists")
+        self.phone_book.update_contact_fields(contact, {FIELD_INDEXES[field]: value for field, value in fields.items()})
+        return contact_summary(contact)
+
+    def do_delete(self, request):
+        names = request["names"]
+        if not isinstance(names, list):
+            raise RequestError("names must be a list of full names")
+        results = self.phone_book.delete_contacts_by_names([str(name) for name in names])
+        return {"deleted": [name for name, contact in results if contact is not None],
+                "not_found": [name for name, contact in results if contact is None]}
+
+    def do_sort(self, request):
+        sort_key = request.get("key", "last_name")
+        if sort_key not in SORT_KEYS:
+            raise RequestError(f"Unknown sort key: {sort_key}")
+        start = int(request.get("start", 0))
+        stop = request.get("stop")
+        stop = start + self.max_results if stop is None else min(int(stop), start + self.max_results)
+        if start < 0 or stop < start:
+            raise RequestError("start and stop must satisfy 0 <= start <= stop")
+        contacts = self.phone_book.sorted_contacts(sort_key, bool(request.get("reverse", False)), start, stop)
+        return {"contacts": [contact_summary(contact) for contact in contacts]}
+
+    def do_group(self, request):
+        letter = request.get("letter")
+        if letter is None:
+            return {"groups": self.phone_book.group_counts()}
+        return self.contact_list(self.phone_book.contacts_in_group(str(letter).upper()))
+
+async def serve(phone_book, host='127.0.0.1', port=8765, unix_path=None, max_results=100):
+    '''
+    Serve phone_book on host:port, or on the Unix socket unix_path, until SIGINT or SIGTERM
+    '''
+    service = PhoneBookService(phone_book, max_results)
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_connection, unix_path, limit=MAX_LINE_LENGTH)
+        address = unix_path
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port, limit=MAX_LINE_LENGTH)
+        address = f"{host}:{server.sockets[0].getsockname()[1]}"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, stop.set)
+    print(f"Serving the phone book on {address}, press Ctrl+C to stop")
+    service.logger.info(f"Start phone book service on {address}")
+    async with server:
+        await stop.wait()
+    service.logger.info("Stop phone book service")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the phone book to concurrent clients with a line-delimited JSON protocol")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on, 0 for any free port (default: 8765)")
+    parser.add_argument("--unix", metavar="SOCKET_PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--sqlite", metavar="DB_PATH", help="serve a SQLite database instead of database.json")
+    parser.add_argument("--max-results", type=int, default=100, help="most contacts returned by one request (default: 100)")
+    parser.add_argument("--stats-file", default="phonebook_stats.json",
+                        help="file the operation statistics are written to on exit (default: phonebook_stats.json)")
+    args = parser.parse_args()
+
+    init_logging()
+    try:
+        phone_book = open_phone_book(args.sqlite)
+    except JournalLockedError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        asyncio.run(serve(phone_book, args.host, args.port, args.unix, args.max_results))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Saving contacts ...")
+        close_phone_book(phone_book)
+        if args.stats_file:
+            phone_book.stats.dump(args.stats_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+from atomic_file import atomic_write
+from contact import Change, Contact
+import gc
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+# Binary snapshot of a phone book, read through mmap so that opening it does not parse any text
+#
+#   header          MAGIC, contact count, change count, then the offset and size of each section below
+#   string heap     UTF-8 strings; the fields of one contact (first name, last name, phone number, phone digits,
+#                   email address, address) or one change are stored together, separated by '\0'
+#   contact table   one fixed-width CONTACT_RECORD per contact: heap offset of its fields, length of its names
+#                   and of all its fields, create and update timestamps, position and length of its history
+#                   in the change table
+#   change table    one fixed-width CHANGE_RECORD per change, the changes of a contact are consecutive
+#
+# Times are the integer timestamps of contact.to_timestamp, so no date needs to be parsed either
+MAGIC = b'PBSNAP02' # the last two characters are the format version
+HEADER = struct.Struct('<8sQQQQQQQQ')
+CONTACT_RECORD = struct.Struct('<QIIqqQI')
+CHANGE_RECORD = struct.Struct('<QIq')
+SEPARATOR = '\0'
+
+class SnapshotError(ValueError):
+    '''
+    Raised when a file is not a valid phone book snapshot
+    '''
+
+def _encode_fields(fields):
+    text = SEPARATOR.join(fields)
+    if text.count(SEPARATOR) != len(fields) - 1:
+        raise ValueError("Contact fields cannot contain NUL characters")
+    return text.encode('utf-8')
+
+def write_snapshot(file_path, contacts):
+    '''
+    Write contacts to a binary snapshot at file_path
+    The snapshot is replaced atomically (see atomic_file.atomic_write), so a crash cannot leave it truncated
+    Fields and histories that were not loaded yet are copied without keeping them in the contacts
+    '''
+    contact_count = 0
+    change_count = 0
+    with atomic_write(file_path, 'wb') as snapshot_file, \
+            tempfile.TemporaryFile() as contact_table, tempfile.TemporaryFile() as change_table:
+        snapshot_file.write(b'\0' * HEADER.size)
+        heap_size = 0
+        for contact in contacts:
+            first_change = change_count
+            for change in contact._uncached_history():
+                data = _encode_fields([change.get_operation(), change.get_message(), change.get_field(),
+                                       change.get_old_value(), change.get_new_value()])
+                change_table.write(CHANGE_RECORD.pack(heap_size, len(data), change.get_change_timestamp()))
+                snapshot_file.write(data)
+                heap_size += len(data)
+                change_count += 1
+            names = _encode_fields([contact.get_first_name(), contact.get_last_name()])
+            data = names + SEPARATOR.encode('utf-8') + _encode_fields(list(contact._uncached_fields()))
+            contact_table.write(CONTACT_RECORD.pack(heap_size, len(names), len(data), contact.get_create_timestamp(),
+                                                    contact.get_update_timestamp(), first_change, change_count - first_change))
+            snapshot_file.write(data)
+            heap_size += len(data)
+            contact_count += 1
+
+        contacts_offset = HEADER.size + heap_size
+        changes_offset = contacts_offset + contact_count * CONTACT_RECORD.size
+        for table in [contact_table, change_table]:
+            table.seek(0)
+            shutil.copyfileobj(table, snapshot_file)
+        snapshot_file.seek(0)
+        snapshot_file.write(HEADER.pack(MAGIC, contact_count, change_count, HEADER.size, heap_size,
+                                        contacts_offset, contact_count * CONTACT_RECORD.size,
+                                        changes_offset, change_count * CHANGE_RECORD.size))
+
+class Snapshot:
+    '''
+    Class to represent an open binary snapshot (see write_snapshot)
+    The file is memory-mapped. Only the names of the contacts are decoded when the contacts are built, their other
+    fields and their history are decoded from the file when they are first accessed
+    On Windows the file is read into memory instead, as a mapped file cannot be replaced by the next snapshot
+    '''
+    def __init__(self, file_path):
+        '''
+        Open the snapshot at file_path
+        Raise FileNotFoundError if it does not exist, or SnapshotError if it is not a valid snapshot
+        '''
+        with open(file_path, 'rb') as snapshot_file:
+            if os.name == 'nt':
+                self._map = snapshot_file.read()
+                if not self._map:
+                    raise SnapshotError(f"{file_path} is empty")
+            else:
+                try:
+                    self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    raise SnapshotError(f"{file_path} is empty")
+        if len(self._map) < HEADER.size:
+            raise SnapshotError(f"{file_path} is not a phone book snapshot")
+        (magic, self.contact_count, self.change_count, heap_offset, heap_size,
+         self._contacts_offset, contacts_size, self._changes_offset, changes_size) = HEADER.unpack_from(self._map)
+        if magic[:6] == MAGIC[:6] and magic != MAGIC:
+            raise SnapshotError(f"{file_path} was written by another version (format {magic[6:].decode('ascii', 'replace')})")
+        if magic != MAGIC:
+            raise SnapshotError(f"{file_path} is not a phone book snapshot")
+        if (contacts_size != self.contact_count * CONTACT_RECORD.size or changes_size != self.change_count * CHANGE_RECORD.size
+                or max(heap_offset + heap_size, self._contacts_offset + contacts_size, self._changes_offset + changes_size) > len(self._map)):
+            raise SnapshotError(f"{file_path} is truncated")
+        self._heap = memoryview(self._map)[heap_offset:heap_offset + heap_size]
+
+    def _fields(self, offset, length):
+        return str(self._heap[offset:offset + length], 'utf-8').split(SEPARATOR)
+
+    def _contact_record(self, position):
+        return CONTACT_RECORD.unpack_from(self._map, self._contacts_offset + position * CONTACT_RECORD.size)
+
+    def fields(self, position):
+        '''
+        Return the phone number, phone digits, email address and address of the contact at position in the contact table
+        '''
+        offset, names_length, length = self._contact_record(position)[:3]
+        return self._fields(offset + names_length + 1, length - names_length - 1)
+
+    def history(self, position):
+        '''
+        Return the Change objects of the contact at position in the contact table
+        '''
+        first_change, change_count = self._contact_record(position)[5:]
+        start = self._changes_offset + first_change * CHANGE_RECORD.size
+        changes = []
+        for offset, length, change_time in CHANGE_RECORD.iter_unpack(self._map[start:start + change_count * CHANGE_RECORD.size]):
+            operation, message, field, old_value, new_value = self._fields(offset, length)
+            changes.append(Change(operation, message, field, old_value, new_value, change_time))
+        return changes
+
+    def contacts(self):
+        '''
+        Return the list of contacts of the snapshot, in their saved order
+        '''
+        contacts = []
+        table = memoryview(self._map)[self._contacts_offset:self._contacts_offset + self.contact_count * CONTACT_RECORD.size]
+        # The new objects cannot form reference cycles, pause the garbage collector instead of letting it rescan them
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for position, (offset, names_length, length, create_time, update_time, first_change, change_count) \
+                    in enumerate(CONTACT_RECORD.iter_unpack(table)):
+                first_name, last_name = self._fields(offset, names_length)
+                contacts.append(Contact.restore(first_name, last_name, create_time, update_time, SnapshotRecord(self, position)))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return contacts
+
+class SnapshotRecord:
+    '''
+    Class to represent the saved record of one contact in an open Snapshot, decoded by Contact on first access
+    (see Contact.restore); one small object per contact instead of the decoded fields and history
+    '''
+    __slots__ = ('_snapshot', '_position')
+
+    def __init__(self, snapshot, position):
+        self._snapshot = snapshot
+        self._position = position
+
+    def fields(self):
+        return self._snapshot.fields(self._position)
+
+    def history(self):
+        return self._snapshot.history(self._position)
+
+def read_snapshot(file_path):
+    '''
+    Return the list of contacts saved in the binary snapshot at file_path
+    The file stays mapped until the fields and histories of all returned contacts are loaded or the contacts are gone
+    '''
+    return Snapshot(file_path).contacts()
+
+def is_snapshot_current(snapshot_path, json_path):
+    '''
+    Check if the snapshot at snapshot_path exists and is at least as recent as the JSON file at json_path
+    '''
+    try:
+        snapshot_time = os.stat(snapshot_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return snapshot_time >= os.stat(json_path).st_mtime_ns
+    except FileNotFoundError:
+        return True
@@ -0,0 +1,364 @@
+from contact import Change, Contact, to_timestamp
+from indexes import FuzzyNameIndex
+from instrumentation import instrumented
+from json_stream import write_json_array
+from phone_book import SEARCH_KEYS, PhoneBook
+from search_cache import cached_search
+from datetime import datetime, time
+import json
+import re
+import sqlite3
+import weakref
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    compact_name TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    phone_digits TEXT NOT NULL,
+    phone_value INTEGER,
+    email_address TEXT NOT NULL,
+    address TEXT NOT NULL,
+    create_time INTEGER NOT NULL,
+    update_time INTEGER NOT NULL,
+    group_letter TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_name_key ON contacts (name_key);
+CREATE INDEX IF NOT EXISTS contacts_first_name ON contacts (lower(first_name));
+CREATE INDEX IF NOT EXISTS contacts_last_name ON contacts (lower(last_name));
+CREATE INDEX IF NOT EXISTS contacts_group_letter ON contacts (group_letter);
+CREATE INDEX IF NOT EXISTS contacts_phone_digits ON contacts (phone_digits);
+CREATE INDEX IF NOT EXISTS contacts_phone_value ON contacts (phone_value);
+CREATE INDEX IF NOT EXISTS contacts_create_time ON contacts (create_time);
+CREATE INDEX IF NOT EXISTS contacts_update_time ON contacts (update_time);
+CREATE TABLE IF NOT EXISTS history (
+    contact_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    operation TEXT NOT NULL,
+    message TEXT NOT NULL,
+    field TEXT NOT NULL,
+    old_value TEXT NOT NULL,
+    new_value TEXT NOT NULL,
+    change_time INTEGER NOT NULL,
+    PRIMARY KEY (contact_id, position)
+);
+'''
+
+# Columns used to sort contacts, by key of phone_book.SORT_KEYS
+SORT_COLUMNS = {
+    'first_name': 'lower(first_name)',
+    'last_name': 'lower(last_name)',
+    'phone_number': 'phone_value',
+    'create_time': 'create_time',
+    'update_time': 'update_time',
+}
+
+CONTACT_COLUMNS = 'id, first_name, last_name, phone_number, email_address, address, create_time, update_time'
+
+# SQLite limits the number of parameters in one statement
+MAX_PARAMETERS = 900
+
+# Number of contacts built at a time when reading every contact
+PAGE_ROWS = 1000
+
+class SQLitePhoneBook(PhoneBook):
+    '''
+    Class to represent a phone book whose contacts are stored in a SQLite database
+    Searches, sorts, grouping and batch operations run as SQL queries on indexed columns,
+    and Contact objects are only built for the rows a query returns
+    '''
+    _connection = None
+
+    def __init__(self, db_path='phonebook.db'):
+        '''
+        Open (or create) the database at db_path
+        '''
+        super().__init__()
+        self._live_contacts = weakref.WeakValueDictionary() # row id -> Contact currently in use
+        self._contact_ids = weakref.WeakKeyDictionary() # Contact -> row id
+        self._connection = sqlite3.connect(db_path)
+        self._add_group_letter_column()
+        self._connection.executescript(SCHEMA)
+
+    def _add_group_letter_column(self):
+        '''
+        Add the group_letter column to a database created before it existed
+        The letter is computed by group_letter in Python: SQLite's upper() only converts ASCII letters
+        '''
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(contacts)")]
+        if not columns or 'group_letter' in columns:
+            return
+        with self._connection:
+            self._connection.execute("DROP INDEX IF EXISTS contacts_last_initial")
+            self._connection.execute("ALTER TABLE contacts ADD COLUMN group_letter TEXT NOT NULL DEFAULT ''")
+            initials = [initial for (initial,) in self._connection.execute("SELECT DISTINCT substr(last_name, 1, 1) FROM contacts")]
+            self._connection.executemany("UPDATE contacts SET group_letter = ? WHERE substr(last_name, 1, 1) = ?",
+                                         [(self.group_letter(initial), initial) for initial in initials])
+
+    def close(self):
+        self._connection.close()
+
+    @property
+    def contacts(self):
+        '''
+        All contacts, in insertion order
+        '''
+        return self._select_contacts("", (), "ORDER BY id")
+
+    @contacts.setter
+    def contacts(self, contacts):
+        '''
+        Replace all stored contacts with the contacts of an iterable, inserted as they are read in one transaction
+        '''
+        if self._connection is None:
+            # PhoneBook.__init__ assigns an empty list before the database is open
+            return
+        self._fuzzy_name_index = None
+        self._contacts_changed()
+        with self._connection:
+            self._connection.execute("DELETE FROM history")
+            self._connection.execute("DELETE FROM contacts")
+            for contact in contacts:
+                self._insert_contact(contact)
+
+    def _replace_contacts(self, contacts):
+        # Rows are inserted while the file is parsed, so the contacts are never all in memory;
+        # a file that fails to parse rolls the transaction back
+        self.contacts = contacts
+
+    def _contact_count(self):
+        return self._connection.execute("SELECT count(*) FROM contacts").fetchone()[0]
+
+    def _paged_contacts(self):
+        '''
+        Yield all contacts in insertion order, building PAGE_ROWS of them at a time
+        '''
+        last_id = 0
+        while True:
+            page = self._select_contacts("WHERE id > ?", (last_id,), f"ORDER BY id LIMIT {PAGE_ROWS}")
+            if not page:
+                return
+            yield from page
+            last_id = self._contact_ids[page[-1]]
+
+    def _contact_slice(self, start, stop):
+        return self._select_contacts("", (), f"ORDER BY id LIMIT {int(stop - start)} OFFSET {int(start)}")
+
+    def _write_contacts(self, json_file, ndjson=False, compact=False):
+        # Only one page of contacts is in memory at a time, see PhoneBook._write_contacts
+        contacts = (contact.to_dict() for contact in self._paged_contacts())
+        if ndjson:
+            for contact in contacts:
+                json_file.write(json.dumps(contact) + "\n")
+        else:
+            write_json_array(json_file, contacts, None if compact else 4)
+
+    # Rows are kept up to date by the SQL indexes, so the in-memory indexes of PhoneBook are not used,
+    # except the fuzzy name index which holds row ids and is kept up to date by the methods changing rows,
+    # which also call _contacts_changed themselves
+    def _index_contact(self, contact):
+        pass
+
+    def _unindex_contact(self, contact):
+        pass
+
+    def _forget_contact(self, contact):
+        pass
+
+    def _rebuild_indexes(self):
+        pass
+
+    def _contact_row(self, contact):
+        first_name, last_name = contact.get_first_name(), contact.get_last_name()
+        phone_digits = contact.get_phone_digits()
+        return (first_name, last_name, self.normalize_name(first_name, last_name),
+                self.compact_name(f"{first_name} {last_name}"), contact.get_phone_number(), phone_digits,
+                int(phone_digits) if phone_digits else None, contact.get_email_address(), contact.get_address(),
+                contact.get_create_timestamp(), contact.get_update_timestamp(), self.group_letter(last_name))
+
+    def _insert_history(self, contact_id, changes, first_position):
+        self._connection.executemany(
+            "INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(contact_id, position, change.get_operation(), change.get_message(), change.get_field(), change.get_old_value(),
+              change.get_new_value(), change.get_change_timestamp())
+             for position, change in enumerate(changes, first_position)])
+
+    def _insert_contact(self, contact):
+        cursor = self._connection.execute(
+            "INSERT INTO contacts (first_name, last_name, name_key, compact_name, phone_number, phone_digits, "
+            "phone_value, email_address, address, create_time, update_time, group_letter) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._contact_row(contact))
+        contact_id = cursor.lastrowid
+        self._insert_history(contact_id, contact.get_history(), 0)
+        if self._fuzzy_name_index is not None:
+            self._fuzzy_name_index.add(contact_id, contact.get_first_name(), contact.get_last_name(), contact_id)
+        self._live_contacts[contact_id] = contact
+        self._contact_ids[contact] = contact_id
+
+    def _select_contacts(self, where, parameters, order):
+        '''
+        Run a query on the contacts table and return the matching Contact objects with their history
+        Contacts that are already in use are returned as the same object
+        '''
+        rows = self._connection.execute(f"SELECT {CONTACT_COLUMNS} FROM contacts {where} {order}", parameters).fetchall()
+        # Keep a strong reference to the live contacts so they cannot be collected while the query runs
+        live_contacts = {row[0]: self._live_contacts.get(row[0]) for row in rows}
+        missing_ids = [contact_id for contact_id, contact in live_contacts.items() if contact is None]
+        histories = {contact_id: [] for contact_id in missing_ids}
+        for start in range(0, len(missing_ids), MAX_PARAMETERS):
+            ids = missing_ids[start:start + MAX_PARAMETERS]
+            for contact_id, operation, message, field, old_value, new_value, change_time in self._connection.execute(
+                    "SELECT contact_id, operation, message, field, old_value, new_value, change_time FROM history "
+                    f"WHERE contact_id IN ({', '.join('?' * len(ids))}) ORDER BY contact_id, position", ids):
+                histories[contact_id].append(Change(operation, message, field, old_value, new_value, change_time))
+
+        contacts = []
+        for contact_id, first_name, last_name, phone_number, email_address, address, create_time, update_time in rows:
+            contact = live_contacts[contact_id]
+            if contact is None:
+                contact = Contact(first_name, last_name, phone_number, email_address, address,
+                                  create_time, update_time, histories[contact_id], log=False)
+                self._live_contacts[contact_id] = contact
+                self._contact_ids[contact] = contact_id
+                live_contacts[contact_id] = contact
+            contacts.append(contact)
+        return contacts
+
+    @instrumented('create')
+    def add_contact(self, contact):
+        with self._connection:
+            self._insert_contact(contact)
+        self._contacts_changed()
+
+    @instrumented('delete')
+    def remove_contact(self, contact):
+        contact_id = self._contact_ids.pop(contact)
+        with self._connection:
+            self._connection.execute("DELETE FROM history WHERE contact_id = ?", (contact_id,))
+            self._connection.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
+        self._live_contacts.pop(contact_id, None)
+        if self._fuzzy_name_index is not None:
+            self._fuzzy_name_index.remove(contact_id)
+        self._contacts_changed()
+
+    def clear_contacts(self):
+        self.contacts = []
+
+    @instrumented('update')
+    def update_contact_fields(self, contact, changes):
+        history_length = len(contact.get_history())
+        super().update_contact_fields(contact, changes)
+        contact_id = self._contact_ids[contact]
+        with self._connection:
+            self._connection.execute(
+                "UPDATE contacts SET first_name = ?, last_name = ?, name_key = ?, compact_name = ?, phone_number = ?, "
+                "phone_digits = ?, phone_value = ?, email_address = ?, address = ?, create_time = ?, update_time = ?, "
+                "group_letter = ? WHERE id = ?", self._contact_row(contact) + (contact_id,))
+            self._insert_history(contact_id, contact.get_history()[history_length:], history_length)
+        if self._fuzzy_name_index is not None:
+            self._fuzzy_name_index.add(contact_id, contact.get_first_name(), contact.get_last_name(), contact_id)
+        self._contacts_changed()
+
+    def _history_replaced(self, contact):
+        contact_id = self._contact_ids[contact]
+        with self._connection:
+            self._connection.execute("DELETE FROM history WHERE contact_id = ?", (contact_id,))
+            self._insert_history(contact_id, contact.get_history(), 0)
+
+    def delete_contacts_by_names(self, full_names):
+        '''
+        Delete the contacts whose full name exactly matches one of the given names (case-insensitive)
+        in a single transaction, looking each name up in the index on the normalized name
+        The index is not unique: if several contacts have the name, the oldest one is deleted
+        Return a list of (full_name, deleted contact or None) in the order the names were given
+        '''
+        results = []
+        to_delete = []
+        seen = set()
+        for full_name in full_names:
+            key = full_name.lower()
+            contacts = [] if key in seen else self._select_contacts("WHERE name_key = ?", (key,), "ORDER BY id LIMIT 1")
+            if contacts:
+                seen.add(key)
+                to_delete.append((self._contact_ids[contacts[0]],))
+                results.append((full_name, contacts[0]))
+            else:
+                results.append((full_name, None))
+
+        with self._connection:
+            self._connection.executemany("DELETE FROM history WHERE contact_id = ?", to_delete)
+            self._connection.executemany("DELETE FROM contacts WHERE id = ?", to_delete)
+        for (contact_id,) in to_delete:
+            contact = self._live_contacts.pop(contact_id, None)
+            if contact is not None:
+                self._contact_ids.pop(contact, None)
+            if self._fuzzy_name_index is not None:
+                self._fuzzy_name_index.remove(contact_id)
+        if to_delete:
+            self._contacts_changed()
+        return results
+
+    def is_contact_exist(self, first_name, last_name):
+        row = self._connection.execute("SELECT 1 FROM contacts WHERE name_key = ?",
+                                       (self.normalize_name(first_name, last_name),)).fetchone()
+        return row is not None
+
+    @instrumented('search_name')
+    @cached_search('name', SEARCH_KEYS['name'])
+    def find_contacts_by_name(self, query):
+        return self._select_contacts("WHERE instr(compact_name, ?) > 0", (self.compact_name(query),), "ORDER BY id")
+
+    @instrumented('search_phone')
+    @cached_search('phone', SEARCH_KEYS['phone'])
+    def find_contacts_by_phone(self, query):
+        query_number = re.sub(r'\D', '', query)
+        if query_number == "":
+            return []
+        return self._select_contacts("WHERE instr(phone_digits, ?) > 0", (query_number,), "ORDER BY id")
+
+    @instrumented('search_fuzzy_name')
+    @cached_search('fuzzy_name', SEARCH_KEYS['fuzzy_name'])
+    def find_contacts_by_fuzzy_name(self, query, max_distance=None):
+        if max_distance is None:
+            max_distance = self.fuzzy_max_distance(query.strip())
+        if self._fuzzy_name_index is None:
+            self._fuzzy_name_index = FuzzyNameIndex()
+            for contact_id, first_name, last_name in self._connection.execute("SELECT id, first_name, last_name FROM contacts"):
+                self._fuzzy_name_index.add(contact_id, first_name, last_name, contact_id)
+        ids = [contact_id for contact_id, distance in self._fuzzy_name_index.search(query, max_distance)]
+        self.stats.count_rows(scanned=self._fuzzy_name_index.last_scanned)
+        contacts = {}
+        for start in range(0, len(ids), MAX_PARAMETERS):
+            chunk = ids[start:start + MAX_PARAMETERS]
+            for contact in self._select_contacts(f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk, ""):
+                contacts[self._contact_ids[contact]] = contact
+        # Keep the closest-first order of the index
+        return [contacts[contact_id] for contact_id in ids]
+
+    @instrumented('search_date')
+    @cached_search('date', SEARCH_KEYS['date'])
+    def find_contacts_by_date(self, start_date, end_date, field='create'):
+        column = 'create_time' if field == 'create' else 'update_time'
+        return self._select_contacts(f"WHERE {column} BETWEEN ? AND ?",
+                                     (to_timestamp(datetime.combine(start_date, time.min)),
+                                      to_timestamp(datetime.combine(end_date, time.max))),
+                                     f"ORDER BY {column}, id")
+
+    @instrumented('sort')
+    def sorted_contacts(self, sort_key, reverse=False, start=0, stop=None):
+        direction = "DESC" if reverse else "ASC"
+        limit = -1 if stop is None else max(stop - start, 0)
+        return self._select_contacts("", (), f"ORDER BY {SORT_COLUMNS[sort_key]} {direction}, id {direction} "
+                                             f"LIMIT {int(limit)} OFFSET {int(start)}")
+
+    @instrumented('group_counts')
+    def group_counts(self):
+        return dict(self._connection.execute("SELECT group_letter, count(*) FROM contacts GROUP BY 1 ORDER BY 1"))
+
+    @instrumented('group')
+    def contacts_in_group(self, letter):
+        return self._select_contacts("WHERE group_letter = ?", (letter,), "ORDER BY id")
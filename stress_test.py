@@ -0,0 +1,145 @@
+from benchmark import generate_contacts, write_database
+from contact import Contact
+from phone_book import PhoneBook
+from thread_safe_phone_book import ThreadSafePhoneBook
+import argparse
+import contextlib
+import functools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+def increment_address(contact):
+    '''
+    Return the change adding 1 to a counter kept in the address field
+    '''
+    return {'5': str(int(contact.get_address()) + 1)}
+
+def unsafe_update(phone_book, full_name, changes):
+    '''
+    Update a contact of a plain PhoneBook the way ThreadSafePhoneBook.update_contact_by_name does, without locking
+    '''
+    contact = phone_book._name_index.get(full_name.lower())
+    if contact is not None:
+        phone_book.update_contact_fields(contact, changes(contact))
+
+def stress(phone_book, counter_names, args):
+    '''
+    Run args.writers threads adding 1 to random counter contacts args.increments times each, one thread creating
+    and deleting contacts, and args.readers threads searching, sorting, grouping and iterating meanwhile
+    Return (lost increments, reads, failures seen by the threads, seconds)
+    '''
+    thread_safe = isinstance(phone_book, ThreadSafePhoneBook)
+    update = phone_book.update_contact_by_name if thread_safe else functools.partial(unsafe_update, phone_book)
+    failures = []
+    reads = [0] * args.readers
+    writing = threading.Event()
+    writing.set()
+
+    def record_failure(error):
+        failures.append(f"{type(error).__name__}: {error}")
+
+    def writer(number):
+        generator = random.Random(number)
+        try:
+            for _ in range(args.increments):
+                update(generator.choice(counter_names), increment_address)
+        except Exception as error:
+            record_failure(error)
+
+    def churn():
+        number = 0
+        try:
+            while writing.is_set():
+                contact = Contact("Churn", f"Contact{number}", "(555) 000-0000", log=False)
+                phone_book.add_contact(contact)
+                phone_book.delete_contacts_by_names([f"Churn Contact{number}"])
+                number += 1
+        except Exception as error:
+            record_failure(error)
+
+    def reader(number):
+        generator = random.Random(-1 - number)
+        try:
+            while writing.is_set():
+                kind = generator.randrange(5)
+                if kind == 0:
+                    phone_book.find_contacts_by_name(generator.choice(counter_names)[:5])
+                elif kind == 1:
+                    phone_book.find_contacts_by_phone(str(generator.randint(200, 999)))
+                elif kind == 2:
+                    phone_book.sorted_contacts('last_name', generator.random() < 0.5, 0, 10)
+                elif kind == 3:
+                    phone_book.contacts_in_group(generator.choice(counter_names).split()[1][0])
+                elif thread_safe:
+                    # The snapshot and the groups must agree while the lock is held
+                    with phone_book.lock.read_locked():
+                        if len(phone_book.snapshot()) != sum(phone_book.group_counts().values()):
+                            raise AssertionError("snapshot and groups disagree")
+                else:
+                    if len(list(phone_book.contacts)) != sum(phone_book.group_counts().values()):
+                        raise AssertionError("contact list and groups disagree")
+                reads[number] += 1
+        except Exception as error:
+            record_failure(error)
+
+    writers = [threading.Thread(target=writer, args=(number,)) for number in range(args.writers)]
+    others = [threading.Thread(target=churn)] + [threading.Thread(target=reader, args=(number,)) for number in range(args.readers)]
+    start = time.perf_counter()
+    for thread in writers + others:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    writing.clear()
+    for thread in others:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    total = sum(int(phone_book._name_index[name.lower()].get_address()) for name in counter_names
+                if name.lower() in phone_book._name_index)
+    return args.writers * args.increments - total, sum(reads), failures, seconds
+
+def run(phone_book_class, database_path, args):
+    phone_book = phone_book_class()
+    phone_book.import_contacts_from_json(database_path, progress_every=0)
+    counter_names = [f"{contact.get_first_name()} {contact.get_last_name()}"
+                     for contact in random.Random(args.seed).sample(phone_book.contacts, args.counters)]
+    for name in counter_names:
+        contact = phone_book._name_index[name.lower()]
+        phone_book.update_contact_fields(contact, {'5': '0'})
+    return stress(phone_book, counter_names, args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Update and search a ThreadSafePhoneBook from many threads at once and check that no update is lost")
+    parser.add_argument("--size", type=int, default=10000, help="number of contacts (default: 10000)")
+    parser.add_argument("--writers", type=int, default=8, help="number of threads incrementing counters (default: 8)")
+    parser.add_argument("--increments", type=int, default=500, help="increments per writer thread (default: 500)")
+    parser.add_argument("--readers", type=int, default=8, help="number of threads searching meanwhile (default: 8)")
+    parser.add_argument("--counters", type=int, default=5, help="number of contacts used as counters (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unsafe", action="store_true", help="also run the same threads on a plain PhoneBook for comparison")
+    args = parser.parse_args()
+
+    # Switch threads as often as possible so that races show up quickly
+    sys.setswitchinterval(1e-6)
+    with tempfile.TemporaryDirectory() as work_dir:
+        database_path = os.path.join(work_dir, "database.json")
+        write_database(database_path, generate_contacts(args.size, 1, args.seed))
+        runs = [("ThreadSafePhoneBook", ThreadSafePhoneBook)] + ([("PhoneBook (no locking)", PhoneBook)] if args.unsafe else [])
+        failed = False
+        for name, phone_book_class in runs:
+            # The Contact setters print every change
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                lost, reads, failures, seconds = run(phone_book_class, database_path, args)
+            print(f"{name}: {args.writers * args.increments} increments from {args.writers} threads, "
+                  f"{reads} reads from {args.readers} threads in {seconds:.2f} s")
+            print(f"  lost updates: {lost}, failures: {len(failures)}" + (f" (first: {failures[0]})" if failures else ""))
+            if phone_book_class is ThreadSafePhoneBook:
+                failed = bool(lost or failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from tabulate import tabulate
+
+PAGE_SIZE = 20 # number of rows shown per page
+
+class PagedSequence:
+    '''
+    Read-only sequence whose slices are fetched when they are used, so that paging through a long list
+    only builds the items of the pages shown
+    get_slice(start, stop) returns the list of items[start:stop]
+    '''
+    def __init__(self, length, get_slice):
+        self._length = length
+        self._get_slice = get_slice
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("PagedSequence only supports slicing")
+        start, stop, step = index.indices(self._length)
+        return self._get_slice(start, max(start, stop))[::step]
+
+    def __iter__(self):
+        return iter(self[:])
+
+def render_page(items, to_row, headers, start, page_size=PAGE_SIZE, show_index=False):
+    '''
+    Render the rows of items[start:start + page_size] as a grid table
+    Column widths are computed from this page only, so rendering does not depend on the size of items
+    to_row converts one item to the list of values of its row
+    '''
+    page_items = items[start:start + page_size]
+    rows = [to_row(item) for item in page_items]
+    index = range(start, start + len(rows)) if show_index else False
+    return tabulate(rows, headers=headers, tablefmt="grid", showindex=index)
+
+def page_through(items, to_row, headers, page_size=PAGE_SIZE, show_index=False):
+    '''
+    Print items page by page, letting the user move to the next or previous page, jump to a page, or stop
+    Row indexes (if shown) are positions in items, so they can be used to select an item afterwards
+    '''
+    page_count = max((len(items) + page_size - 1) // page_size, 1)
+    page = 0
+    while True:
+        start = page * page_size
+        print(render_page(items, to_row, headers, start, page_size, show_index))
+        print(f"Page {page + 1}/{page_count} (rows {start + 1}-{min(start + page_size, len(items))} of {len(items)})")
+        if page_count == 1:
+            return
+
+        command = input("Enter n (or press Enter) for next page, p for previous page, a page number to jump to, or q to stop: ").strip().lower()
+        while True:
+            if command == 'q' or (command == '' and page + 1 == page_count):
+                return
+            if command in ['n', ''] and page + 1 < page_count:
+                page += 1
+                break
+            if command == 'p' and page > 0:
+                page -= 1
+                break
+            if command.isdigit() and 1 <= int(command) <= page_count:
+                page = int(command) - 1
+                break
+            command = input("Invalid choice. Please try again: ").strip().lower()
@@ -0,0 +1,124 @@
+from phone_book import PhoneBook
+from rwlock import ReadWriteLock
+import functools
+import threading
+
+def _read_locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read_locked():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _write_locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write_locked():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class ThreadSafePhoneBook(PhoneBook):
+    '''
+    Class to represent a phone book shared by several threads, e.g. the workers of a threaded web server
+    Searches, sorts, groups and exports hold the read lock of self.lock, so any number of them run at once;
+    every change (create, update, delete, import, journal replay) holds the write lock and runs alone
+    Code reading several things that must agree with each other can hold self.lock.read_locked() around them
+    The interactive menu methods wait for input while reading, they are not meant to be used from several threads
+    '''
+    def __init__(self):
+        super().__init__()
+        self.lock = ReadWriteLock()
+        self._build_lock = threading.Lock() # held while a reader builds a lazy index, see PhoneBook._rebuild_indexes
+        self._snapshot = None # tuple of the contacts returned by snapshot(), None after a change
+
+    def snapshot(self):
+        '''
+        Return the contacts as a tuple that can be iterated without holding the lock while other threads make changes
+        The tuple is built once after each change and shared by all readers, so reading it does not copy the list
+        It holds the live Contact objects: their fields are the current ones, not the ones at the time of the snapshot
+        '''
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.lock.read_locked():
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = tuple(self.contacts)
+        return snapshot
+
+    def update_contact_by_name(self, full_name, changes):
+        '''
+        Find the contact whose full name exactly matches full_name (case-insensitive) and update several of its fields,
+        as one step that no other thread can interleave with
+        changes maps field indexes (see update_contact_field) to new values, or is a function called with the contact
+        under the write lock and returning that mapping, for new values computed from the current ones
+        Return the updated contact, or None if no contact has that name
+        '''
+        with self.lock.write_locked():
+            contact = self._name_index.get(full_name.lower())
+            if contact is None:
+                return None
+            if callable(changes):
+                changes = changes(contact)
+            self.update_contact_fields(contact, changes)
+            return contact
+
+    # The lazy indexes are built (or taken from build_indexes_in_background) by the first search needing them while
+    # other searches hold the read lock too, so this is serialized; the base methods only store an index once it is complete
+    def _partial_indexes(self):
+        if self._partial_name_index is None:
+            with self._build_lock:
+                return super()._partial_indexes()
+        return super()._partial_indexes()
+
+    def _fuzzy_index(self):
+        if self._fuzzy_name_index is None:
+            with self._build_lock:
+                return super()._fuzzy_index()
+        return super()._fuzzy_index()
+
+    def _sorted_index(self, sort_key):
+        if sort_key not in self._sorted_indexes:
+            with self._build_lock:
+                return super()._sorted_index(sort_key)
+        return super()._sorted_index(sort_key)
+
+    # Every change of the contact list or of a contact goes through these hooks, under the write lock
+    def _index_contact(self, contact):
+        self._snapshot = None
+        super()._index_contact(contact)
+
+    def _forget_contact(self, contact):
+        self._snapshot = None
+        super()._forget_contact(contact)
+
+    def _rebuild_indexes(self):
+        self._snapshot = None
+        super()._rebuild_indexes()
+
+    is_contact_exist = _read_locked(PhoneBook.is_contact_exist)
+    find_contacts_by_name = _read_locked(PhoneBook.find_contacts_by_name)
+    find_contacts_by_phone = _read_locked(PhoneBook.find_contacts_by_phone)
+    find_contacts_by_fuzzy_name = _read_locked(PhoneBook.find_contacts_by_fuzzy_name)
+    find_contacts_by_date = _read_locked(PhoneBook.find_contacts_by_date)
+    sorted_contacts = _read_locked(PhoneBook.sorted_contacts)
+    group_counts = _read_locked(PhoneBook.group_counts)
+    contacts_in_group = _read_locked(PhoneBook.contacts_in_group)
+    grouped_contacts = _read_locked(PhoneBook.grouped_contacts)
+    export_contacts_to_json = _read_locked(PhoneBook.export_contacts_to_json)
+    export_contacts_to_snapshot = _read_locked(PhoneBook.export_contacts_to_snapshot)
+
+    add_contact = _write_locked(PhoneBook.add_contact)
+    remove_contact = _write_locked(PhoneBook.remove_contact)
+    clear_contacts = _write_locked(PhoneBook.clear_contacts)
+    update_contact_field = _write_locked(PhoneBook.update_contact_field)
+    update_contact_fields = _write_locked(PhoneBook.update_contact_fields)
+    delete_contacts_by_names = _write_locked(PhoneBook.delete_contacts_by_names)
+    delete_contacts_from_csv = _write_locked(PhoneBook.delete_contacts_from_csv)
+    import_contacts_from_csv = _write_locked(PhoneBook.import_contacts_from_csv)
+    import_contacts_from_json = _write_locked(PhoneBook.import_contacts_from_json)
+    import_contacts_from_snapshot = _write_locked(PhoneBook.import_contacts_from_snapshot)
+    archive_histories = _write_locked(PhoneBook.archive_histories)
+    open_journal = _write_locked(PhoneBook.open_journal)
+    close_journal = _write_locked(PhoneBook.close_journal)
+    compact_journal = _write_locked(PhoneBook.compact_journal)
+    build_indexes_in_background = _write_locked(PhoneBook.build_indexes_in_background)
@@ -0,0 +1,21 @@
+import re
+
+# Regular expression for validating an email address: (user_name)@(domain_name).(top-leveldomain)
+EMAIL_REGEX = re.compile(r'([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+')
+
+# Regular expression for validating a phone number: (###) ###-####
+PHONE_NUMBER_REGEX = re.compile(r'\(\d{3}\) \d{3}-\d{4}')
+
+def is_valid_email(email):
+    '''
+    Check if the email address is valid, an empty email address is valid
+    '''
+    if email == "":
+        return True
+    return EMAIL_REGEX.fullmatch(email) is not None
+
+def is_valid_phone_number(phone_number):
+    '''
+    Check if the phone number is in the format (###) ###-####
+    '''
+    return PHONE_NUMBER_REGEX.fullmatch(phone_number) is not None